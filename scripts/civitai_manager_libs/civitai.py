@@ -1,26 +1,73 @@
 import os
 import re
 import json
-import requests
+import copy
+import threading
+import urllib.parse
+import concurrent.futures
 from . import util
 from . import setting 
+from . import httpclient
+from . import httpcache
 
 # Set the URL for the API endpoint
 
 url_dict = {
     "modelPage":"https://civitai.com/models/",
     "modelId": "https://civitai.com/api/v1/models/",
+    "models": "https://civitai.com/api/v1/models",
     "modelVersionId": "https://civitai.com/api/v1/model-versions/",
     "modelHash": "https://civitai.com/api/v1/model-versions/by-hash/",
     "imagePage" :  "https://civitai.com/api/v1/images"
 }
 
+# 요청이 제한(429)되어 결과를 받지 못했을때 None 대신 돌려주는 값, 거짓으로 평가된다.
+Throttled = httpclient.Throttled
+
+def is_throttled(result)->bool:
+    return httpclient.is_throttled(result)
+
+# 같은 url 을 동시에 요청하면 먼저 들어온 요청 하나만 보내고 나머지는 그 결과를 기다려 같이 쓴다.
+# 결과를 바꾸는 호출자가 있을수 있으므로 먼저 보낸 쪽은 결과를, 기다린 쪽은 각자 복사본을 가진다.
+_inflight = dict()  # url : {"event": threading.Event, "result": 기다린 쪽이 복사할 결과, "waiters": 기다리는 수}
+_inflight_lock = threading.Lock()
+
+def single_flight(url, func):
+    with _inflight_lock:
+        call = _inflight.get(url)
+        leader = call is None
+        if leader:
+            call = {"event": threading.Event(), "result": None, "waiters": 0}
+            _inflight[url] = call
+        else:
+            call["waiters"] = call["waiters"] + 1
+
+    if not leader:
+        call["event"].wait()
+        return copy.deepcopy(call["result"])
+
+    result = None
+    try:
+        result = func(url)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(url, None)
+            waiters = call["waiters"]
+        # 먼저 보낸 쪽이 결과를 바꾸기 전에 기다린 쪽이 쓸 복사본을 만들어 둔다.
+        call["result"] = copy.deepcopy(result) if waiters else None
+        call["event"].set()
+
+    return result
+
 def Url_Page():
     return url_dict["modelPage"]
 
 def Url_ModelId():
     return url_dict["modelId"]
 
+def Url_Models():
+    return url_dict["models"]
+
 def Url_VersionId():
     return url_dict["modelVersionId"]
 
@@ -31,10 +78,18 @@ def Url_ImagePage():
     return url_dict["imagePage"]
 
 def request_models(api_url=None):
+    if not api_url:
+        return
+    return single_flight(api_url, request_models_page)
+
+def request_models_page(api_url):
     try:
         # Make a GET request to the API
-        with requests.get(api_url, verify=False, proxies=setting.proxies) as response:
+        with httpclient.get(api_url) as response:
             # Check the status code of the response
+            if response.status_code == 429:
+                util.printD("Request throttled: {}".format(api_url))
+                return httpclient.Throttled(api_url, response.headers.get("Retry-After"))
             if response.status_code != 200:
                 util.printD("Request failed with status code: {}".format(response.status_code))
                 return         
@@ -49,8 +104,9 @@ def get_model_info(id:str) -> dict:
     
     content = None
     try:            
-        with requests.get(Url_ModelId()+str(id), verify=False, proxies=setting.proxies) as response:
-            content = response.json()
+        content = single_flight(Url_ModelId()+str(id), httpcache.get_json)
+        if is_throttled(content):
+            return content
 
         if 'id' not in content.keys():
             return None
@@ -60,6 +116,58 @@ def get_model_info(id:str) -> dict:
 
     return content
 
+# 여러 모델의 정보를 모델 목록 api 의 ids 필터로 한번에 받는다. { modelid : model_info }
+# setting.model_infos_chunk_size 개씩 나누어 요청하고 metadata.nextPage 를 따라간다.
+# 목록에서 빠진 모델은 하나씩 다시 요청하며, 요청이 제한된 모델의 값은 Throttled 이다.
+def get_model_infos(ids:list) -> dict:
+    result = dict()
+    if not ids:
+        return result
+    
+    modelids = list()
+    for modelid in ids:
+        if modelid and str(modelid) not in modelids:
+            modelids.append(str(modelid))
+    
+    chunk_size = max(1, setting.model_infos_chunk_size)
+    for i in range(0, len(modelids), chunk_size):
+        chunk = modelids[i:i + chunk_size]
+        query = urllib.parse.urlencode([("limit", len(chunk))] + [("ids", modelid) for modelid in chunk])
+        page_url = f"{Url_Models()}?{query}"
+        
+        while page_url:
+            json_data = request_models(page_url)
+            if is_throttled(json_data):
+                for modelid in chunk:
+                    if modelid not in result.keys():
+                        result[modelid] = json_data
+                break
+            
+            if not json_data or not json_data.get("items"):
+                break
+            
+            for model_info in json_data.get("items", []):
+                if model_info and "id" in model_info.keys():
+                    result[str(model_info["id"])] = model_info
+                    # 하나씩 요청할때도 쓸수 있게 응답 캐시에 넣어둔다.
+                    httpcache.put(Url_ModelId()+str(model_info["id"]), model_info)
+            
+            # 요청한 모델을 모두 받았으면 다음 페이지를 요청하지 않는다.
+            if all(modelid in result.keys() for modelid in chunk):
+                break
+            
+            page_url = json_data.get("metadata", {}).get("nextPage")
+    
+    missing = [modelid for modelid in modelids if modelid not in result.keys()]
+    if missing:
+        workers = max(1, min(setting.shortcut_update_workers, len(missing)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for modelid, model_info in zip(missing, executor.map(get_model_info, missing)):
+                if model_info or is_throttled(model_info):
+                    result[modelid] = model_info
+                
+    return result
+
 def get_model_info_by_version_id(version_id:str) -> dict:        
     if not version_id:
         return
@@ -79,8 +187,9 @@ def get_version_info_by_hash(hash) -> dict:
     content = None
     
     try:
-        with requests.get(f"{Url_Hash()}{hash}", verify=False, proxies=setting.proxies) as response:
-            content = response.json()
+        content = single_flight(f"{Url_Hash()}{hash}", httpcache.get_json)
+        if is_throttled(content):
+            return content
             
         if 'id' not in content.keys():
             return None
@@ -90,6 +199,68 @@ def get_version_info_by_hash(hash) -> dict:
 
     return content  
   
+# 여러 해시의 버전 정보를 by-hash api 에 한번에 요청한다. { hash(소문자) : version_info }
+# setting.hash_lookup_chunk_size 개씩 나누어 보내고, 목록 요청이 실패하면 하나씩 동시에 요청한다.
+# 목록 요청에 성공했는데 빠진 해시는 civitai 에 없는 모델이다. 요청이 제한된 해시의 값은 Throttled 이다.
+def get_version_infos_by_hash(hashes:list) -> dict:
+    result = dict()
+    if not hashes:
+        return result
+    
+    hash_list = list()
+    for hash in hashes:
+        if hash and hash.lower() not in hash_list:
+            hash_list.append(hash.lower())
+    
+    failed = list()
+    chunk_size = max(1, setting.hash_lookup_chunk_size)
+    for i in range(0, len(hash_list), chunk_size):
+        chunk = hash_list[i:i + chunk_size]
+        version_infos = request_version_infos_by_hash(chunk)
+        if is_throttled(version_infos):
+            for hash in chunk:
+                result[hash] = version_infos
+            continue
+        
+        if version_infos is None:
+            failed.extend(chunk)
+            continue
+        
+        for version_info in version_infos:
+            if not version_info or "files" not in version_info.keys():
+                continue
+            for file in version_info["files"]:
+                try:
+                    file_hash = file["hashes"]["SHA256"].lower()
+                except Exception as e:
+                    continue
+                if file_hash in chunk:
+                    result[file_hash] = version_info
+                    httpcache.put(f"{Url_Hash()}{file_hash}", version_info)
+    
+    if failed:
+        workers = max(1, min(setting.shortcut_update_workers, len(failed)))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for hash, version_info in zip(failed, executor.map(get_version_info_by_hash, failed)):
+                if version_info or is_throttled(version_info):
+                    result[hash] = version_info
+                    
+    return result
+
+def request_version_infos_by_hash(hashes:list):
+    try:
+        with httpclient.post(Url_Hash().rstrip("/"), json=hashes) as response:
+            if response.status_code == 429:
+                return httpclient.Throttled(Url_Hash(), response.headers.get("Retry-After"))
+            if response.status_code != 200:
+                util.printD("Request failed with status code: {}".format(response.status_code))
+                return None
+            content = response.json()
+    except Exception as e:
+        return None
+    
+    return content if isinstance(content, list) else None
+
 def get_version_info_by_version_id(version_id:str) -> dict:        
     if not version_id:                
         return 
@@ -97,8 +268,9 @@ def get_version_info_by_version_id(version_id:str) -> dict:
     content = None
     
     try:
-        with requests.get(Url_VersionId()+str(version_id), verify=False, proxies=setting.proxies) as response:
-            content = response.json()
+        content = single_flight(Url_VersionId()+str(version_id), httpcache.get_json)
+        if is_throttled(content):
+            return content
 
         if 'id' not in content.keys():
             return None
@@ -112,7 +284,7 @@ def get_latest_version_info_by_model_id(id:str) -> dict:
 
     model_info = get_model_info(id)
     if not model_info:
-        return
+        return model_info if is_throttled(model_info) else None
 
     if "modelVersions" not in model_info.keys():
         return
@@ -131,6 +303,23 @@ def get_latest_version_info_by_model_id(id:str) -> dict:
 
     return version_info
 
+# 모델 정보의 첫번째 버전이 최신 버전이다. 버전 정보를 따로 받지 않고 요청 한번으로 끝낸다.
+def get_latest_version_id_by_model_id(id:str):
+    model_info = get_model_info(id)
+    if not model_info:
+        return model_info if is_throttled(model_info) else None
+
+    return get_latest_version_id_by_model_info(model_info)
+
+def get_latest_version_id_by_model_info(model_info):
+    if not model_info:
+        return None
+
+    try:
+        return str(model_info["modelVersions"][0]["id"]).strip()
+    except Exception as e:
+        return None
+
 def get_version_id_by_version_name(model_id:str,name:str)->str:
     version_id = None
     if not model_id:
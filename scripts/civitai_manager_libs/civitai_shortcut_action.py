@@ -1,9 +1,12 @@
 import gradio as gr
 import datetime
 import os
+import time
+import threading
 
 from . import model
 from . import civitai
+from . import refresh_scheduler
 from . import setting
 from . import sc_browser_page
 
@@ -13,6 +16,9 @@ from . import model_action
 from . import ishortcut_action
 from . import civitai_gallery_action
 
+_latest_version_cache = dict()  # modelid : (확인한 시간, 최신 버전 아이디)
+_latest_version_lock = threading.Lock()
+
 def on_shortcut_input_change(shortcut_input):
     if not shortcut_input:
         return None, gr.update(visible=False), gr.update(selected="Shortcut")
@@ -316,8 +322,9 @@ def on_scan_new_version_btn(sc_types, progress=gr.Progress()):
     shortlist =  get_shortcut_list(sc_types,True)
     
     if shortlist:        
-        for short in progress.tqdm(shortlist, desc="Scanning new version model"):            
-            if not is_latest(str(short['id'])):
+        latest_list = check_latest_versions([str(short['id']) for short in shortlist], progress)
+        for short in shortlist:
+            if not latest_list.get(str(short['id'])):
                 if not scan_list:
                     scan_list = list()
                 scan_list.append(short)
@@ -359,22 +366,69 @@ def is_latest(modelid:str)->bool:
         return False
    
     if str(modelid) in model.Downloaded_Models.keys():
-        # civitai 에서 최신 모델 정보를 가져온다.
-        version_info = civitai.get_latest_version_info_by_model_id(str(modelid))
-        if version_info:
-            latest_versionid = str(version_info['id']).strip()                
-            # util.printD(latest_versionid)
-            # 현재 가지고 있는 버전들을 가져온다.                
-            dnver_list = list()                
-            for vid, version_paths in model.Downloaded_Models[str(modelid)]:
-                dnver_list.append(str(vid).strip())
-                
-                # util.printD(dnver_list)
-            if latest_versionid in dnver_list:     
-                # util.printD("True")                   
-                return True
+        # civitai 에서 최신 버전을 가져온다.
+        latest_versionid = get_latest_version_id(str(modelid))
+        if latest_versionid:
+            return is_downloaded_version(modelid, latest_versionid)
     return False
 
+def is_downloaded_version(modelid, versionid)->bool:
+    # 현재 가지고 있는 버전들을 가져온다.                
+    dnver_list = list()                
+    for vid, version_paths in model.Downloaded_Models[str(modelid)]:
+        dnver_list.append(str(vid).strip())
+        
+    return str(versionid) in dnver_list
+
+# 모델의 최신 버전 아이디를 setting.latest_version_check_ttl 초 동안 저장해두고 다시 쓴다.
+def get_latest_version_id(modelid:str):
+    now = time.time()
+    with _latest_version_lock:
+        if modelid in _latest_version_cache:
+            checked, latest_versionid = _latest_version_cache[modelid]
+            if now - checked < setting.latest_version_check_ttl:
+                return latest_versionid
+            
+    latest_versionid = civitai.get_latest_version_id_by_model_id(modelid)
+    if latest_versionid:
+        with _latest_version_lock:
+            _latest_version_cache[modelid] = (now, latest_versionid)
+    return latest_versionid
+
+# 다운받은 모델들의 최신 버전을 동시에 확인한다. { modelid : 최신 버전을 가지고 있는지 }
+# 요청이 제한되어 확인하지 못한 모델은 최신으로 본다.
+def check_latest_versions(modelid_list:list, progress=None)->dict:
+    result = dict()
+    modelid_list = [str(modelid) for modelid in modelid_list if modelid and str(modelid) in model.Downloaded_Models.keys()]
+    
+    # 확인한지 오래된 모델은 한번에 받아서 최신 버전을 갱신해둔다.
+    now = time.time()
+    with _latest_version_lock:
+        stale_list = [modelid for modelid in modelid_list if modelid not in _latest_version_cache.keys() or now - _latest_version_cache[modelid][0] >= setting.latest_version_check_ttl]
+        
+    if len(stale_list) > 1:
+        for modelid, model_info in civitai.get_model_infos(stale_list).items():
+            latest_versionid = civitai.get_latest_version_id_by_model_info(model_info)
+            if latest_versionid:
+                with _latest_version_lock:
+                    _latest_version_cache[modelid] = (now, latest_versionid)
+    
+    throttled = 0
+    for modelid, latest_versionid in ishortcut.run_concurrent(get_latest_version_id, modelid_list, progress, "Scanning new version model", False):
+        if latest_versionid:
+            result[modelid] = is_downloaded_version(modelid, latest_versionid)
+            if not result[modelid]:
+                refresh_scheduler.mark_new_version(modelid)
+        elif civitai.is_throttled(latest_versionid):
+            result[modelid] = True
+            throttled = throttled + 1
+        else:
+            result[modelid] = False
+            
+    if throttled > 0:
+        util.printD(f"{throttled} models were throttled and skipped while scanning new versions")
+    return result
+
 # def update_shortcut_information(modelid):
 #     if not modelid:    
 #         return    
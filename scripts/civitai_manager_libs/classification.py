@@ -1,8 +1,12 @@
 import os
+import copy
 import json
+import threading
 
 from . import util
 from . import setting
+from . import journal
+from . import storelock
 #============================================================
 #=======================wrap=================================
 def get_classification_names_by_modelid(modelid):
@@ -10,63 +14,77 @@ def get_classification_names_by_modelid(modelid):
     if not modelid:
         return
     
-    CISC = load()
-    if CISC:
-        c_name_list = [k for k , v in CISC.items() if str(modelid) in v['shortcuts']]
+    CISC_sets, CISC_reverse = get_index()
+    if str(modelid) in CISC_reverse:
+        c_name_list = list(CISC_reverse[str(modelid)].keys())
 
     return c_name_list
 
 def clean_classification_shortcut(modelid):
-    CISC = load()
-    if CISC:
-        for cis in CISC.values():
-            if str(modelid) in cis['shortcuts']:
-                cis['shortcuts'].remove(str(modelid))
+    with store_lock():
+        CISC_sets, CISC_reverse = get_index()
+        if not CISC_sets:
+            return False
+    
+        # 해당 모델이 속한 분류만 수정한다.
+        names = list(CISC_reverse.get(str(modelid), dict()).keys())
+        if not names:
+            return True
+        
+        CISC = load()
+        if CISC:
+            for name in names:
+                if name in CISC:
+                    CISC[name]['shortcuts'] = [mid for mid in CISC[name]['shortcuts'] if mid != str(modelid)]
                 
-        save(CISC)
-        return True
-    return False
+            save(CISC)
+            return True
+        return False
 
 def add_classification_shortcut(name, modelid):
-    if name and len(name.strip()) > 0:
-        CISC = load()
-        if CISC:                   
-            if name in CISC:
-                CISC[name]['shortcuts'].append(str(modelid))
-                save(CISC)
-                return True
-    return False
+    with store_lock():
+        if name and len(name.strip()) > 0:
+            CISC = load()
+            if CISC:                   
+                if name in CISC:
+                    if str(modelid) not in get_shortcut_set(name):
+                        CISC[name]['shortcuts'].append(str(modelid))
+                        save(CISC)
+                    return True
+        return False
 
 def update_classification_shortcut(s_name, shortcuts):
-    if not s_name:
-        return
+    with store_lock():
+        if not s_name:
+            return
         
-    CISC = load()
-    CISC = update_shortcut(CISC,s_name, shortcuts)
+        CISC = load()
+        CISC = update_shortcut(CISC,s_name, shortcuts)
     
-    save(CISC)
+        save(CISC)
 
-    return True
+        return True
 
 def update_classification(s_name, name, info):
-    if not s_name:
-        return
+    with store_lock():
+        if not s_name:
+            return
 
-    if not name:
-        return
+        if not name:
+            return
     
-    name = name.strip()
+        name = name.strip()
         
-    CISC = load()
-    CISC = update(CISC, s_name, name, info)    
+        CISC = load()
+        CISC = update(CISC, s_name, name, info)    
     
-    save(CISC)
+        save(CISC)
     
-    if CISC:
-        if name in CISC:
-            return True
+        if CISC:
+            if name in CISC:
+                return True
         
-    return False
+        return False
 
 def get_classification_shortcuts(s_name):
     if not s_name:
@@ -79,28 +97,30 @@ def get_classification_shortcuts(s_name):
     return None
 
 def create_classification(name, info):
-    if name and len(name.strip()) > 0:
-        CISC = load()
+    with store_lock():
+        if name and len(name.strip()) > 0:
+            CISC = load()
         
-        if CISC:
-            if name in CISC:
-                return False
+            if CISC:
+                if name in CISC:
+                    return False
         
-        CISC = create(CISC, name.strip(), info)
-        save(CISC)
+            CISC = create(CISC, name.strip(), info)
+            save(CISC)
         
-        if CISC:
-            if name in CISC:
-                return True
-    return False
+            if CISC:
+                if name in CISC:
+                    return True
+        return False
 
 def delete_classification(s_name):
-    if not s_name:
-        return
+    with store_lock():
+        if not s_name:
+            return
         
-    CISC = load()
-    CISC = delete(CISC,s_name)
-    save(CISC)
+        CISC = load()
+        CISC = delete(CISC,s_name)
+        save(CISC)
                     
     
 def get_classification(s_name):
@@ -123,6 +143,36 @@ def get_classification_info(s_name):
     
     return None
 
+def get_shortcut_set(s_name)->frozenset:
+    if not s_name:
+        return frozenset()
+    
+    CISC_sets, CISC_reverse = get_index()
+    return CISC_sets.get(s_name.strip(), frozenset())
+
+# 여러 분류에 모두 속한 숏컷을 구한다. (and 연산)
+def get_shortcuts_intersection(s_names)->set:
+    if not s_names:
+        return set()
+    
+    CISC_sets, CISC_reverse = get_index()
+    
+    sets = list()
+    for name in s_names:
+        if not name or name.strip() not in CISC_sets:
+            return set()
+        sets.append(CISC_sets[name.strip()])
+    
+    # 작은 집합부터 교집합을 구한다.
+    sets.sort(key=len)
+    result = set(sets[0])
+    for sc_set in sets[1:]:
+        if not result:
+            break
+        result &= sc_set
+        
+    return result
+
 def get_list():
     
     CISC = load()                           
@@ -267,32 +317,37 @@ def update(CISC:dict, classification, name, info):
     return CISC
 
 def save(CISC:dict):
-    output = ""
-    
-    #write to file
-    try:
-        with open(setting.shortcut_classification, 'w') as f:
-            json.dump(CISC, f, indent=4)
-    except Exception as e:
-        util.printD("Error when writing file:"+setting.shortcut_classification)
-        return output
+    with store_lock():
+        output = ""
+    
+        # 저장되어 있는 내용과 비교하여 바뀐 부분만 journal 에 기록한다.
+        old_CISC = get_cache() if os.path.isfile(setting.shortcut_classification) else None
+    
+        #write to file
+        if not journal.write(setting.shortcut_classification, CISC, old_CISC):
+            invalidate_cache()
+            return output
 
-    output = "Civitai Internet Shortcut Classification saved to: " + setting.shortcut_classification
-    #util.printD(output)
+        set_cache(CISC)
+    
+        output = "Civitai Internet Shortcut Classification saved to: " + setting.shortcut_classification
+        #util.printD(output)
 
-    return output
+        return output
 
 def load()->dict:
-    if not os.path.isfile(setting.shortcut_classification):        
+    CISC = get_cache()
+    if not CISC:
+        return None
+    
+    return copy.deepcopy(CISC)
+
+def read_file()->dict:
+    if not os.path.isfile(setting.shortcut_classification) and not os.path.isfile(journal.journal_path(setting.shortcut_classification)):
         save({})
         return
     
-    json_data = None
-    try:
-        with open(setting.shortcut_classification, 'r') as f:
-            json_data = json.load(f)
-    except:
-        return None            
+    json_data = journal.read(setting.shortcut_classification)
 
     # check error
     if not json_data:
@@ -300,4 +355,73 @@ def load()->dict:
 
     # check for new key
     return json_data
+
+#================= cache =================================
+# 파일이 바뀌거나 save 를 통해 쓸때만 다시 읽는다.
+
+# 캐시와 함께 분류별 숏컷 집합과 modelid -> 분류 역색인을 유지한다.
+# 파일에는 기존처럼 리스트로 저장한다.
+
+_CISC_cache = None
+_CISC_stat = None
+_CISC_sets = dict()       # classification : frozenset(modelid)
+_CISC_reverse = dict()    # modelid : {classification : None} (순서를 유지하는 집합)
+_CISC_lock = threading.RLock()
+
+def set_cache(CISC:dict):
+    global _CISC_cache, _CISC_stat, _CISC_sets, _CISC_reverse
+    
+    with _CISC_lock:
+        _CISC_cache = copy.deepcopy(CISC) if CISC else None
+        _CISC_stat = journal.stat(setting.shortcut_classification)
+        
+        CISC_sets = dict()
+        CISC_reverse = dict()
+        if _CISC_cache:
+            for name, v in _CISC_cache.items():
+                shortcuts = frozenset(str(mid) for mid in v['shortcuts']) if v and v.get('shortcuts') else frozenset()
+                CISC_sets[name] = shortcuts
+                for mid in shortcuts:
+                    if mid not in CISC_reverse:
+                        CISC_reverse[mid] = dict()
+                    CISC_reverse[mid][name] = None
+                    
+        _CISC_sets = CISC_sets
+        _CISC_reverse = CISC_reverse
+
+def invalidate_cache():
+    global _CISC_stat
+    
+    with _CISC_lock:
+        _CISC_stat = None
+    
+def get_cache()->dict:
+    with _CISC_lock:
+        if _CISC_stat is not None and _CISC_stat == journal.stat(setting.shortcut_classification):
+            return _CISC_cache
+    
+    # 파일 잠금을 먼저 잡고 캐시 잠금을 잡는다.
+    with store_lock():
+        with _CISC_lock:
+            if _CISC_stat is not None and _CISC_stat == journal.stat(setting.shortcut_classification):
+                return _CISC_cache
+            
+            try:
+                CISC = read_file()
+            except Exception as e:
+                # 읽지 못했다면 마지막으로 읽은 내용을 그대로 사용한다.
+                util.printD("Error when reading file:" + setting.shortcut_classification)
+                return _CISC_cache
+            
+            set_cache(CISC)
+            return _CISC_cache
+
+def store_lock():
+    return storelock.lock(setting.shortcut_classification)
+
+def get_index():
+    # get_cache 는 파일 잠금을 잡을수 있으므로 캐시 잠금 밖에서 부른다.
+    get_cache()
+    with _CISC_lock:
+        return _CISC_sets, _CISC_reverse
 #=========================================================================
\ No newline at end of file
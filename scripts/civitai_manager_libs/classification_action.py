@@ -330,7 +330,7 @@ def on_classification_gallery_loading(shortcuts, page=0):
     totals = 0
     max_page = 1    
     cur_page = 1
-    ISC = ishortcut.load()
+    ISC = ishortcut.load_view()
     if not ISC:
         return None, gr.update(minimum=1),gr.update(visible=False)
         
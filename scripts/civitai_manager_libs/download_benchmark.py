@@ -0,0 +1,96 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+import http.server
+
+from . import util
+from . import setting
+from . import hashcache
+from . import downloader
+
+# 로컬 http 서버에서 파일을 받아서 버퍼 크기별 다운로드 속도를 잰다.
+# 네트워크가 아닌 다운로더(쓰기, 해시, 진행 표시)가 얼마나 빠른지 보기 위한 것이다.
+#   from scripts.civitai_manager_libs import download_benchmark
+#   download_benchmark.run(size=1024 * 1024 * 1024)
+
+def start_server(data):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            # 나누어 받는 경로를 잴수 있도록 Range 요청에는 206 으로 답한다.
+            start, end = 0, len(data) - 1
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)), end) if match.group(2) else end
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{len(data)}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+            else:
+                self.send_response(200)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            view = memoryview(data)[start:end + 1]
+            try:
+                for start in range(0, len(view), 1024 * 1024):
+                    self.wfile.write(view[start:start + 1024 * 1024])
+            except (ConnectionError, BrokenPipeError):
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# 버퍼 크기별 (초, MB/s) 를 돌려준다. segments 가 2 이상이면 나누어 받는 경로를 잰다.
+def run(size=256 * 1024 * 1024, buffer_sizes=None, segments=1, repeat=1)->dict:
+    if not buffer_sizes:
+        buffer_sizes = [64 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024]
+
+    data = os.urandom(size)
+    server = start_server(data)
+    url = f"http://127.0.0.1:{server.server_port}/benchmark.bin"
+    folder = tempfile.mkdtemp()
+
+    saved = (setting.download_buffer_size, setting.download_segments, setting.download_segment_threshold)
+    results = dict()
+    try:
+        setting.download_segments = segments
+        setting.download_segment_threshold = 0 if segments > 1 else size + 1
+
+        for buffer_size in buffer_sizes:
+            setting.download_buffer_size = buffer_size
+            elapsed = None
+            for i in range(max(1, repeat)):
+                file_name = os.path.join(folder, f"benchmark_{buffer_size}_{i}.bin")
+                start = time.perf_counter()
+                downloader.download_file(url, file_name)
+                seconds = time.perf_counter() - start
+                if not os.path.isfile(file_name) or os.path.getsize(file_name) != size:
+                    util.printD(f"Benchmark download incomplete : {file_name}")
+                elapsed = seconds if elapsed is None else min(elapsed, seconds)
+                downloader.remove_partial_file(file_name)
+                hashcache.remove(file_name)
+                if os.path.isfile(file_name):
+                    os.remove(file_name)
+
+            results[buffer_size] = (elapsed, size / elapsed / (1024 * 1024))
+            util.printD(f"buffer {buffer_size // 1024} KB : {elapsed:.2f}s {results[buffer_size][1]:.1f} MB/s")
+    finally:
+        setting.download_buffer_size, setting.download_segments, setting.download_segment_threshold = saved
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return results
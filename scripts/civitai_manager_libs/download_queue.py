@@ -0,0 +1,216 @@
+import uuid
+import datetime
+import threading
+
+from . import util
+from . import setting
+from . import journal
+from . import downloader
+
+# 모델 파일 다운로드 대기열
+# 작업은 CivitaiShortCutDownloadQueue.json 에 저장되고 setting.download_workers 개의 작업자가 우선순위 순서로 받는다.
+# 프로그램이 종료될때 받던 작업은 다음 시작때 이어 받는다.
+#   {"job id": {"id":, "url":, "file_name":, "hashes":, "priority":, "status":, "created":, "updated":, "error":}}
+# hashes 는 civitai 의 파일 해시로 다 받은 파일을 검증하는데 쓴다.
+# status : queued, downloading, paused, done, failed, cancelled
+
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+PAUSED = "paused"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+_jobs = None
+_stop_events = dict()   # job id : 받는중인 작업을 멈추는 threading.Event
+_cond = threading.Condition(threading.RLock())
+_workers = list()
+
+def now()->str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+def load():
+    global _jobs
+
+    if _jobs is not None:
+        return _jobs
+
+    _jobs = dict()
+    try:
+        data = journal.read(setting.shortcut_download_queue)
+        if data:
+            _jobs = data
+    except Exception as e:
+        util.printD("Error when reading file:" + setting.shortcut_download_queue)
+
+    return _jobs
+
+def save():
+    journal.write_snapshot(setting.shortcut_download_queue, _jobs)
+
+def add(url, file_name, priority=0, hashes=None)->str:
+    if not url or not file_name:
+        return None
+
+    with _cond:
+        jobs = load()
+
+        # 같은 파일을 받는 작업이 있으면 그 작업을 쓴다.
+        for job in jobs.values():
+            if job["file_name"] == file_name and job["status"] in (QUEUED, DOWNLOADING, PAUSED):
+                return job["id"]
+
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = {
+            "id": job_id,
+            "url": url,
+            "file_name": file_name,
+            "hashes": hashes,
+            "priority": int(priority),
+            "status": QUEUED,
+            "created": now(),
+            "updated": now(),
+            "error": None
+        }
+        save()
+        _cond.notify_all()
+
+    start()
+    return job_id
+
+def set_status(job_id, status, error=None):
+    with _cond:
+        jobs = load()
+        if job_id not in jobs:
+            return False
+        jobs[job_id]["status"] = status
+        jobs[job_id]["updated"] = now()
+        jobs[job_id]["error"] = error
+        save()
+        _cond.notify_all()
+    return True
+
+def set_priority(job_id, priority)->bool:
+    with _cond:
+        jobs = load()
+        if job_id not in jobs:
+            return False
+        jobs[job_id]["priority"] = int(priority)
+        save()
+        _cond.notify_all()
+    return True
+
+def pause(job_id)->bool:
+    with _cond:
+        job = load().get(job_id)
+        if not job or job["status"] not in (QUEUED, DOWNLOADING):
+            return False
+        set_status(job_id, PAUSED)
+        if job_id in _stop_events:
+            _stop_events[job_id].set()
+    return True
+
+def resume(job_id)->bool:
+    with _cond:
+        job = load().get(job_id)
+        if not job or job["status"] not in (PAUSED, FAILED):
+            return False
+        set_status(job_id, QUEUED)
+    start()
+    return True
+
+def cancel(job_id)->bool:
+    with _cond:
+        job = load().get(job_id)
+        if not job or job["status"] in (DONE, CANCELLED):
+            return False
+        downloading = job["status"] == DOWNLOADING
+        set_status(job_id, CANCELLED)
+        if job_id in _stop_events:
+            _stop_events[job_id].set()
+
+    # 받는중이면 작업자가 멈춘 후에 지운다.
+    if not downloading:
+        downloader.remove_partial_file(job["file_name"])
+    return True
+
+# 끝났거나 취소된 작업을 목록에서 지운다.
+def clear_finished():
+    with _cond:
+        jobs = load()
+        for job_id in [k for k, v in jobs.items() if v["status"] in (DONE, CANCELLED)]:
+            del jobs[job_id]
+        save()
+
+# ui 에서 주기적으로 불러 쓰는 상태 정보, 우선순위 순서로 돌려준다.
+def get_status()->list:
+    with _cond:
+        jobs = [dict(job) for job in load().values()]
+
+    for job in jobs:
+        job["downloaded"], job["total"] = downloader.get_download_progress(job["file_name"])
+
+    return sorted(jobs, key=lambda job: (-job["priority"], job["created"]))
+
+def next_job():
+    jobs = [job for job in load().values() if job["status"] == QUEUED]
+    if not jobs:
+        return None
+    return sorted(jobs, key=lambda job: (-job["priority"], job["created"]))[0]
+
+def worker():
+    while True:
+        with _cond:
+            job = next_job()
+            while not job:
+                _cond.wait()
+                job = next_job()
+
+            job_id = job["id"]
+            stop_event = threading.Event()
+            _stop_events[job_id] = stop_event
+            set_status(job_id, DOWNLOADING)
+
+        error = None
+        try:
+            result = downloader.download_file(job["url"], job["file_name"], stop_event, job.get("hashes"))
+        except Exception as e:
+            result = False
+            error = str(e)
+            util.printD(f"Download failed : {job['file_name']} : {e}")
+
+        with _cond:
+            _stop_events.pop(job_id, None)
+            status = load()[job_id]["status"] if job_id in load() else None
+
+            if status == CANCELLED:
+                downloader.remove_partial_file(job["file_name"])
+            elif status == DOWNLOADING:
+                if not result and not error:
+                    error = "Download failed or the file hash did not match"
+                set_status(job_id, DONE if result else FAILED, None if result else error)
+
+def start():
+    with _cond:
+        jobs = load()
+
+        # 지난번에 받던 작업은 다시 대기열에 넣는다.
+        if not _workers:
+            changed = False
+            for job in jobs.values():
+                if job["status"] == DOWNLOADING:
+                    job["status"] = QUEUED
+                    changed = True
+            if changed:
+                save()
+
+        while len(_workers) < max(1, setting.download_workers):
+            try:
+                thread = threading.Thread(target=worker, daemon=True)
+                thread.start()
+                _workers.append(thread)
+            except Exception as e:
+                util.printD(e)
+                break
+
+        _cond.notify_all()
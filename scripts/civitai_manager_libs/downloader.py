@@ -1,14 +1,18 @@
 import os
 import re
 import time
-import requests
 import threading
+import concurrent.futures
 import shutil
 import json
 
 from . import util
 from . import setting
+from . import httpclient
 from . import civitai
+from . import resolver
+from . import hashcache
+from . import download_queue
 
 from tqdm import tqdm
 
@@ -44,7 +48,7 @@ def download_file_thread(file_name, version_id, ms_folder, vs_folder, vs_foldern
     if not file_name or not version_id:
         return
     
-    version_info = civitai.get_version_info_by_version_id(version_id)
+    version_info = resolver.get_version_info(version_id)
     
     if not version_info:
         return 
@@ -72,8 +76,7 @@ def download_file_thread(file_name, version_id, ms_folder, vs_folder, vs_foldern
         try:
             #모델 파일 저장
             path_dl_file = os.path.join(model_folder, file)            
-            thread = threading.Thread(target=download_file,args=(download_files[str(fid)]['downloadUrl'], path_dl_file))
-            thread.start()                
+            download_queue.add(download_files[str(fid)]['downloadUrl'], path_dl_file, hashes=download_files[str(fid)].get('hashes'))
 
             # 파일 아이디에 해당하는 파일명을 변경한다.
             # 실제 다운 로드 되는 파일명으로 변경한다.
@@ -147,7 +150,7 @@ def download_preview_image(filepath, version_info):
                     if img_dict["width"]:
                         img_url =  util.change_width_from_image_url(img_url, img_dict["width"])
                 # get image
-                with requests.get(img_url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+                with httpclient.get(img_url, stream=True) as img_r:
                     if not img_r.ok:
                         util.printD("Get error code: " + str(img_r.status_code))
                         return False
@@ -237,7 +240,7 @@ def download_image_file(model_name, image_urls, progress_gr=None):
             elif result == "url":
                 try:
                     # get image
-                    with requests.get(img_url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+                    with httpclient.get(img_url, stream=True) as img_r:
                         if not img_r.ok:
                             util.printD("Get error code: " + str(img_r.status_code) + ": proceed to the next file")
                         else:
@@ -251,77 +254,544 @@ def download_image_file(model_name, image_urls, progress_gr=None):
                     pass
     return 
 
-def download_file(url, file_name):
-    # Maximum number of retries
-    max_retries = 5
-
-    # Delay between retries (in seconds)
-    retry_delay = 10
+# 받은 내용은 스레드마다 하나씩 만든 큰 버퍼(setting.download_buffer_size)에 readinto 로 채워서 쓴다.
+# 작은 조각마다 파일 쓰기, 해시, 진행 표시를 반복하지 않도록 한다.
+_buffers = threading.local()
+
+def get_buffer():
+    size = max(64 * 1024, setting.download_buffer_size)
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = bytearray(size)
+        _buffers.buffer = buffer
+    return buffer
+
+# 응답 내용을 버퍼 크기만큼씩 돌려준다.
+# 돌려주는 memoryview 는 다음 읽기에서 덮어쓰므로 바로 써야 한다.
+def iter_response(response, stop_event=None):
+    buffer = get_buffer()
+
+    # 압축된 응답은 풀어야 하므로 requests 에 맡긴다.
+    if response.headers.get("Content-Encoding", "identity").lower() not in ("identity", ""):
+        for chunk in response.iter_content(chunk_size=len(buffer)):
+            if stop_event and stop_event.is_set():
+                return
+            if chunk:
+                yield chunk
+        return
 
+    view = memoryview(buffer)
     while True:
-        # Check if the file has already been partially downloaded
-        if os.path.exists(file_name):
-            # Get the size of the downloaded file
-            downloaded_size = os.path.getsize(file_name)
+        if stop_event and stop_event.is_set():
+            return
+        size = response.raw.readinto(view)
+        if not size:
+            return
+        yield view[:size]
+
+# tqdm 갱신을 interval 초에 한번으로 줄인다. flush=True 이면 모아둔 크기를 바로 반영한다.
+def throttled_progress(progress, interval=0.5):
+    state = {"size": 0, "time": time.monotonic()}
+
+    def update(size, flush=False):
+        state["size"] = state["size"] + size
+        now = time.monotonic()
+        if state["size"] and (flush or now - state["time"] >= interval):
+            progress.update(state["size"])
+            state["size"] = 0
+            state["time"] = now
+
+    return update
+
+# 파일을 전체 크기로 미리 만든다. posix_fallocate 를 쓸수 있으면 디스크 공간을 실제로 잡아둔다.
+def preallocate(file_name, total_size):
+    with open(file_name, "wb") as f:
+        if setting.download_preallocate and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(f.fileno(), 0, total_size)
+                return
+            except OSError:
+                # 지원하지 않는 파일 시스템
+                pass
+        f.truncate(total_size)
+
+# 모델 파일은 <파일>.part 에 받고, 다 받아서 해시까지 확인되면 원래 이름으로 바꾼다.(os.replace)
+# 받다가 만 파일을 다 받은 모델로 잘못 읽는 일이 없다.
+# 받는 정보는 <파일>.part.json 에 저장해서 다시 시작해도 바로 이어 받는다.
+#   {"url": ..., "size": 전체 크기(모르면 None), "etag": ..., "offset": 디스크에 쓰여진 크기, "segments": [[시작, 끝, 받은 크기], ...]}
+# segments 는 여러 구간으로 나누어 받을때만 있다. 정보는 내용을 디스크에 쓴(fsync) 다음에 저장한다.
+# 다 받으면 True, 실패하거나 stop_event 로 멈추거나 해시가 다르면 False
+part_info_save_interval = 5
+
+def part_path(file_name):
+    return f"{file_name}.part"
+
+def part_info_path(file_name):
+    return f"{file_name}.part.json"
+
+def load_part_info(file_name):
+    path = part_info_path(file_name)
+    if not os.path.isfile(path) or not os.path.isfile(part_path(file_name)):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        return None
+
+def sync_file(path):
+    try:
+        fd = os.open(path, os.O_RDWR)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def save_part_info(file_name, part_info):
+    # 구간을 받는 스레드들이 계속 받은 크기를 늘리므로 디스크에 쓰기(fsync) 전의 값을 저장한다.
+    data = json.dumps(part_info)
+    sync_file(part_path(file_name))
+
+    path = part_info_path(file_name)
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        util.printD("Error when writing file:" + path)
+
+def remove_part_info(file_name):
+    try:
+        os.remove(part_info_path(file_name))
+    except OSError:
+        pass
+
+def make_segments(total_size, count):
+    count = max(1, count)
+    segment_size = max(1, -(-total_size // count))
+    return [[start, min(start + segment_size, total_size) - 1, 0] for start in range(0, total_size, segment_size)]
+
+# Range 요청으로 (전체 크기, 리다이렉트된 실제 주소, ETag) 를 알아낸다. 지원하지 않으면 (None, None, None)
+def probe_range_support(url):
+    try:
+        with httpclient.get(url, headers={"Range": "bytes=0-0"}, stream=True) as response:
+            if response.status_code != 206:
+                return None, None, None
+            content_range = response.headers.get("Content-Range", "")
+            match = re.match(r"bytes\s+0-0/(\d+)", content_range)
+            if not match:
+                return None, None, None
+            return int(match.group(1)), response.url, response.headers.get("ETag")
+    except Exception as e:
+        return None, None, None
+
+# 응답 내용이 파일의 어디서 시작하는지와 전체 크기, 전체 크기를 모르면 None
+def get_response_range(response):
+    if response.status_code == 206:
+        match = re.match(r"bytes\s+(\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", ""))
+        if not match:
+            raise ConnectionError("Invalid Content-Range : " + response.headers.get("Content-Range", ""))
+        return int(match.group(1)), int(match.group(2)) if match.group(2) != "*" else None
+
+    if response.headers.get("Content-Encoding", "identity").lower() not in ("identity", ""):
+        return 0, None
+
+    content_length = response.headers.get("Content-Length")
+    return 0, int(content_length) if content_length else None
+
+def download_segment(url, file_name, segment, on_progress, stop_event=None):
+    start, end, done = segment
+    if start + done > end:
+        return True
+
+    headers = {"Range": f"bytes={start + done}-{end}"}
+    with httpclient.get(url, headers=headers, stream=True) as response:
+        if response.status_code != 206:
+            raise ConnectionError(f"Range request refused : {response.status_code}")
+
+        with open(file_name, "r+b") as f:
+            f.seek(start + done)
+            for chunk in iter_response(response, stop_event):
+                chunk = chunk[:end - (start + segment[2]) + 1]
+                f.write(chunk)
+                # 해시 스레드가 받은 크기만큼 읽을수 있도록 바로 쓴다.
+                f.flush()
+                segment[2] = segment[2] + len(chunk)
+                on_progress(len(chunk))
+                if start + segment[2] > end:
+                    break
 
-            # Set the range of the request to start from the current size of the downloaded file
-            headers = {"Range": f"bytes={downloaded_size}-"}
+    if stop_event and stop_event.is_set():
+        return False
+    return start + segment[2] > end
+
+# 앞에서부터 빈틈없이 받아진 크기
+def get_contiguous_size(segments)->int:
+    size = 0
+    for start, end, done in segments:
+        size = start + done
+        if start + done <= end:
+            break
+    return size
+
+# 받는 동안 앞에서부터 이어서 받아진 부분까지 해시를 계산한다.
+# 방금 쓴 부분이므로 대부분 디스크가 아닌 캐시에서 읽는다.
+# 다 받으면(finished) 남은 부분을 마저 계산해서 해시를 돌려주고, 중단되면(aborted) None
+def hash_segments(file_name, segments, finished, aborted):
+    hashers = hashcache.new_hashers()
+    hashed = 0
+    try:
+        while not aborted.is_set():
+            done = finished.is_set()
+            size = get_contiguous_size(segments)
+            hashcache.update_from_file(hashers, file_name, hashed, size)
+            hashed = size
+            if done:
+                return hashers
+            finished.wait(0.5)
+    except Exception as e:
+        util.printD(f"Unable to hash while downloading : {file_name} : {e}")
+    return None
+
+# 받은 파일의 해시를 civitai 의 파일 해시와 비교하고 원래 이름으로 바꾼다.
+# 해시가 다르면 손상된 파일이므로 지우고 False 를 돌려준다.
+def complete_download(file_name, hashers, expected_hashes)->bool:
+    tokens = re.split(re.escape('\\'), file_name)
+    file_name_display = tokens[-1]
+
+    file_hashes = hashcache.hexdigests(hashers) if hashers else None
+    verified = hashcache.verify(file_hashes, expected_hashes)
+    if verified is False:
+        util.printD(f"Hash mismatch, removing corrupt download : {file_name} : {file_hashes} expected {expected_hashes}")
+        remove_partial_file(file_name)
+        return False
+
+    try:
+        os.replace(part_path(file_name), file_name)
+    except OSError as e:
+        util.printD(f"Unable to rename downloaded file : {file_name} : {e}")
+        return False
+    remove_part_info(file_name)
+
+    if file_hashes:
+        hashcache.put(file_name, file_hashes, verified)
+    if verified:
+        util.printD(f"Verified : {file_name}")
+
+    print(f"{file_name_display} successfully downloaded.")
+    return True
+
+# 큰 파일은 여러 구간으로 나누어 동시에 받는다.
+# 전체 크기만큼 .part 파일을 미리 만들어 두고 각 구간을 자기 위치에 쓴다.
+# 서버가 Range 를 지원하지 않거나 작은 파일이면 None 을 돌려주고 하나의 연결로 받는다.
+# 해시는 앞에서부터 이어서 받아진 부분까지 따라가며 계산한다.(hash_segments)
+def download_file_segmented(url, file_name, stop_event=None, hashes=None):
+    if setting.download_segments <= 1:
+        return None
+
+    part = part_path(file_name)
+    part_info = load_part_info(file_name)
+    if part_info and not part_info.get("segments"):
+        # 하나의 연결로 받던 파일은 그대로 이어 받는다.
+        return None
+
+    total_size, real_url, etag = probe_range_support(url)
+    if part_info:
+        if total_size != part_info["size"] or (etag and part_info.get("etag") and etag != part_info["etag"]):
+            # 파일이 바뀌었거나 Range 를 지원하지 않으면 처음부터 다시 받는다.
+            util.printD(f"Remote file changed, restarting download : {file_name}")
+            remove_partial_file(file_name)
+            part_info = None
+
+    if not part_info:
+        if not total_size or total_size < setting.download_segment_threshold:
+            return None
+
+        part_info = {"url": url, "size": total_size, "etag": etag, "offset": 0, "segments": make_segments(total_size, setting.download_segments)}
+        try:
+            preallocate(part, total_size)
+        except Exception as e:
+            util.printD(f"Unable to create file : {part}")
+            return None
+        save_part_info(file_name, part_info)
+
+    tokens = re.split(re.escape('\\'), file_name)
+    file_name_display = tokens[-1]
+
+    segments = part_info["segments"]
+    progress = tqdm(total=total_size, unit="B", unit_scale=True, desc=f"Downloading {file_name_display}", initial=sum(s[2] for s in segments), leave=False)
+    progress_lock = threading.Lock()
+    update_progress = throttled_progress(progress)
+    saved = {"time": time.monotonic()}
+
+    def on_progress(size):
+        with progress_lock:
+            update_progress(size)
+            # 받은 위치를 가끔 저장해 둔다.
+            if time.monotonic() - saved["time"] >= part_info_save_interval:
+                saved["time"] = time.monotonic()
+                part_info["offset"] = get_contiguous_size(segments)
+                save_part_info(file_name, part_info)
+
+    def run(segment):
+        retries = 5
+        while True:
+            error = None
+            try:
+                # 서명된 주소는 만료될수 있으므로 실패하면 원래 주소로 다시 받는다.
+                if download_segment(real_url if retries == 5 else url, part, segment, on_progress, stop_event):
+                    return True
+            except Exception as e:
+                error = e
+            
+            if stop_event and stop_event.is_set():
+                return False
+                
+            retries = retries - 1
+            if retries == 0:
+                util.printD(f"Segment download failed : {file_name_display} {segment[0]}-{segment[1]} : {error}")
+                return False
+            time.sleep(2)
+
+    finished = threading.Event()
+    aborted = threading.Event()
+    hash_result = dict()
+    hash_thread = threading.Thread(target=lambda: hash_result.update(hashers=hash_segments(part, segments, finished, aborted)), daemon=True)
+    hash_thread.start()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(segments)) as executor:
+        results = list(executor.map(run, segments))
+
+    update_progress(0, True)
+    progress.close()
+
+    if not all(results):
+        aborted.set()
+    finished.set()
+    hash_thread.join()
+
+    with progress_lock:
+        part_info["offset"] = get_contiguous_size(segments)
+        save_part_info(file_name, part_info)
+
+    if all(results):
+        return complete_download(file_name, hash_result.get("hashers"), hashes)
+    
+    if stop_event and stop_event.is_set():
+        print(f"Download stopped. {file_name_display}")
+    else:
+        print(f"Error: File download failed. Download again to resume... {file_name_display}")
+    return False
+
+# 받다가 만 파일과 받는 정보를 지운다.
+def remove_partial_file(file_name):
+    remove_part_info(file_name)
+    try:
+        os.remove(part_path(file_name))
+    except OSError:
+        pass
+
+# (받은 크기, 전체 크기) 전체 크기를 모르면 None
+def get_download_progress(file_name):
+    part_info = load_part_info(file_name)
+    if part_info:
+        if part_info.get("segments"):
+            return sum(segment[2] for segment in part_info["segments"]), part_info["size"]
+        return part_info["offset"], part_info["size"]
+
+    if os.path.isfile(file_name):
+        size = os.path.getsize(file_name)
+        return size, size
+
+    return 0, None
+
+# 원래 이름으로 있는 파일을 확인한다. 이전 버전은 받는 중에도 원래 이름으로 썼으므로 받다가 만 파일일수 있다.
+# 서버의 파일 크기, civitai 의 SHA256 과 비교해서
+# 다 받은 파일이면 True, 이어 받을수 있으면 False, 처음부터 다시 받아야 하면 None 을 돌려준다.
+def check_existing_file(url, file_name, hashes):
+    size = os.path.getsize(file_name)
+    total_size, real_url, etag = probe_range_support(url)
+    if total_size:
+        if size < total_size:
+            return False
+        if size > total_size:
+            return None
+
+    if not hashes or not hashes.get("SHA256"):
+        # 비교할 해시가 없으면 크기가 같거나 크기를 알수 없을때 다 받은 것으로 본다.
+        return True
+
+    sha256 = hashcache.get_sha256(file_name)
+    verified = hashcache.verify({"SHA256": sha256}, hashes)
+    if verified:
+        hashcache.put(file_name, {"SHA256": sha256}, True)
+        return True
+
+    # 크기를 모르면 앞부분만 받은 파일일수 있으므로 이어 받고, 다 받은 뒤에 다시 확인한다.
+    return False if not total_size else None
+
+# 원래 이름의 파일을 .part 로 옮겨서 이어 받을수 있게 한다.
+def resume_existing_file(url, file_name)->bool:
+    part = part_path(file_name)
+    try:
+        os.replace(file_name, part)
+    except OSError as e:
+        util.printD(f"Unable to resume existing file : {file_name} : {e}")
+        return False
+    hashcache.remove(file_name)
+    save_part_info(file_name, {"url": url, "size": None, "etag": None, "offset": os.path.getsize(part)})
+    return True
+
+# 다 받으면 True, 멈추거나(stop_event) 해시가 hashes(civitai 의 파일 해시)와 다르면 False 를 돌려준다.
+# 해시는 받으면서 계산해서 hashcache 에 저장하므로 스캔할때 파일을 다시 읽지 않는다.
+def download_file(url, file_name, stop_event=None, hashes=None):
+    # Split filename from included path
+    tokens = re.split(re.escape('\\'), file_name)
+    file_name_display = tokens[-1]
+
+    if os.path.isfile(file_name) and not os.path.isfile(part_path(file_name)):
+        complete = check_existing_file(url, file_name, hashes)
+        if complete:
+            print(f"{file_name_display} already downloaded.")
+            return True
+
+        if complete is None:
+            util.printD(f"Existing file does not match, downloading again : {file_name}")
+            hashcache.remove(file_name)
+            try:
+                os.remove(file_name)
+            except OSError as e:
+                util.printD(f"Unable to remove existing file : {file_name} : {e}")
+                return False
         else:
-            downloaded_size = 0
-            headers = {}
+            util.printD(f"Incomplete file found, resuming download : {file_name}")
+            if not resume_existing_file(url, file_name):
+                return False
+
+    result = download_file_segmented(url, file_name, stop_event, hashes)
+    if result is not None:
+        return result
+
+    part = part_path(file_name)
+    part_info = load_part_info(file_name)
+    if part_info and part_info.get("url") == url:
+        if part_info.get("segments"):
+            # 나누어 받던 파일은 앞에서부터 이어진 부분까지만 쓴다.
+            part_info["offset"] = get_contiguous_size(part_info["segments"])
+            del part_info["segments"]
+        # 정보를 저장한 뒤에 쓴 내용은 믿을수 없으므로 저장된 위치부터 다시 받는다.
+        part_info["offset"] = min(part_info["offset"], os.path.getsize(part))
+    else:
+        remove_partial_file(file_name)
+        part_info = {"url": url, "size": None, "etag": None, "offset": 0}
 
-        # Split filename from included path
-        tokens = re.split(re.escape('\\'), file_name)
-        file_name_display = tokens[-1]
+    # 이어 받을때는 이미 받은 부분의 해시를 먼저 계산한다.
+    hashers = hashcache.new_hashers()
+    try:
+        hashcache.update_from_file(hashers, part, 0, part_info["offset"])
+    except Exception as e:
+        hashers = None
 
-        # Initialize the progress bar
-        progress = tqdm(total=1000000000, unit="B", unit_scale=True,
-                        desc=f"Downloading {file_name_display}", initial=downloaded_size, leave=False)
+    # Maximum number of retries
+    max_retries = 5
 
-        # Open a local file to save the download
-        with open(file_name, "ab") as f:
-            while True:
-                try:
-                    # Send a GET request to the URL and save the response to the local file
-                    response = requests.get(url, headers=headers, stream=True, verify=False, proxies=setting.proxies)
+    # Delay between retries (in seconds)
+    retry_delay = 10
 
-                    # Get the total size of the file
-                    total_size = int(response.headers.get("Content-Length", 0))
+    # Initialize the progress bar
+    progress = tqdm(total=part_info["size"], unit="B", unit_scale=True,
+                    desc=f"Downloading {file_name_display}", initial=part_info["offset"], leave=False)
+    update_progress = throttled_progress(progress)
 
-                    # Update the total size of the progress bar if the `Content-Length` header is present
-                    if total_size == 0:
-                        total_size = downloaded_size
+    while True:
+        error = None
+        try:
+            headers = dict()
+            if part_info["offset"] > 0:
+                # Set the range of the request to start from the verified offset
+                headers["Range"] = f"bytes={part_info['offset']}-"
+                if part_info.get("etag"):
+                    # 파일이 바뀌었으면 서버가 처음부터(200) 보낸다.
+                    headers["If-Range"] = part_info["etag"]
+
+            with httpclient.get(url, headers=headers, stream=True) as response:
+                if response.status_code == 416 and part_info["offset"] and part_info["offset"] == part_info["size"]:
+                    # 이미 다 받았다.
+                    pass
+                elif response.status_code not in (200, 206):
+                    if response.status_code == 416:
+                        part_info["offset"] = 0
+                    raise ConnectionError(f"Get error code: {response.status_code}")
+                else:
+                    start, total_size = get_response_range(response)
+                    if start != part_info["offset"]:
+                        # 서버가 Range 를 무시했거나 파일이 바뀌었으면 처음부터 받는다.
+                        util.printD(f"Unable to resume, restarting download : {file_name}")
+                        part_info["offset"] = 0
+                        hashers = hashcache.new_hashers()
+                        progress.reset(total=total_size)
+                        if start != 0:
+                            raise ConnectionError(f"Unexpected Content-Range : {start}")
+
+                    part_info["size"] = total_size
+                    part_info["etag"] = response.headers.get("ETag")
                     progress.total = total_size
-
-                    # Write the response to the local file and update the progress bar
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:  # filter out keep-alive new chunks
+                    if part_info["offset"] == 0:
+                        if total_size:
+                            preallocate(part, total_size)
+                        else:
+                            open(part, "wb").close()
+                    save_part_info(file_name, part_info)
+
+                    # Write the response to the part file and update the progress bar
+                    with open(part, "r+b") as f:
+                        f.seek(part_info["offset"])
+                        saved_time = time.monotonic()
+                        for chunk in iter_response(response, stop_event):
                             f.write(chunk)
-                            progress.update(len(chunk))
-
-                    downloaded_size = os.path.getsize(file_name)
-                    # Break out of the loop if the download is successful
-                    break
-                except ConnectionError as e:
-                    # Decrement the number of retries
-                    max_retries -= 1
+                            if hashers:
+                                hashcache.update(hashers, chunk)
+                            part_info["offset"] = part_info["offset"] + len(chunk)
+                            update_progress(len(chunk))
+                            # 받은 위치를 가끔 저장해 둔다.
+                            if time.monotonic() - saved_time >= part_info_save_interval:
+                                f.flush()
+                                save_part_info(file_name, part_info)
+                                saved_time = time.monotonic()
+                        f.flush()
+                        if part_info["size"] is None or part_info["offset"] >= part_info["size"]:
+                            # 미리 잡아둔 공간이 남지 않도록 받은 크기로 맞춘다.
+                            f.truncate(part_info["offset"])
+        except Exception as e:
+            error = e
 
-                    # If there are no more retries, raise the exception
-                    if max_retries == 0:
-                        raise e
+        update_progress(0, True)
+        if os.path.isfile(part):
+            save_part_info(file_name, part_info)
 
-                    # Wait for the specified delay before retrying
-                    time.sleep(retry_delay)
+        if stop_event and stop_event.is_set():
+            progress.close()
+            print(f"Download stopped. {file_name_display}")
+            return False
 
-        # Close the progress bar
-        progress.close()
-        downloaded_size = os.path.getsize(file_name)
         # Check if the download was successful
-        if downloaded_size >= total_size:            
-            print(f"{file_name_display} successfully downloaded.")
-            break
-        else:
-            print(f"Error: File download failed. Retrying... {file_name_display}")   
+        if error is None and (part_info["size"] is None or part_info["offset"] >= part_info["size"]):
+            progress.close()
+            return complete_download(file_name, hashers, hashes)
+
+        # Decrement the number of retries
+        max_retries -= 1
+        if max_retries == 0:
+            progress.close()
+            print(f"Error: File download failed. Download again to resume... {file_name_display} : {error}")
+            return False
+
+        print(f"Error: File download failed. Retrying... {file_name_display} : {error}")
+        # Wait for the specified delay before retrying
+        time.sleep(retry_delay)
 
 # 테스트중이다. download_file를 대체할것... 거의 같다.
 def download_file_gr(url, file_name, progress_gr=None):
@@ -352,7 +822,7 @@ def download_file_gr(url, file_name, progress_gr=None):
             while True:
                 try:
                     # Send a GET request to the URL and save the response to the local file
-                    response = requests.get(url, headers=headers, stream=True)
+                    response = httpclient.get(url, headers=headers, stream=True)
 
                     # Get the total size of the file
                     total_size = int(response.headers.get("Content-Length", 0))
@@ -365,10 +835,11 @@ def download_file_gr(url, file_name, progress_gr=None):
                     progress = tqdm(range(total_size), total=total_size, unit="B", unit_scale=True, desc=f"Downloading {file_name_display}", initial=downloaded_size, leave=False)
                     
                     # Write the response to the local file and update the progress bar
-                    for chunk in response.iter_content(chunk_size=1024):
-                        if chunk:  # filter out keep-alive new chunks
-                            f.write(chunk)
-                            progress.update(len(chunk))                            
+                    update_progress = throttled_progress(progress)
+                    for chunk in iter_response(response):
+                        f.write(chunk)
+                        update_progress(len(chunk))
+                    update_progress(0, True)
 
                     downloaded_size = os.path.getsize(file_name)
                     # Break out of the loop if the download is successful
@@ -0,0 +1,196 @@
+import os
+import zlib
+import contextlib
+import hashlib
+import threading
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+from . import util
+from . import setting
+from . import journal
+
+# 모델 파일의 해시를 CivitaiShortCutHashCache.json 에 저장해 두고 다시 계산하지 않는다.
+# 다운로더는 받으면서 계산한 해시를, 스캔은 계산한 SHA256 을 저장한다.
+# 파일의 크기와 수정 시간이 저장할때와 같을때만 저장된 해시를 쓴다.
+#   {"파일 경로": {"size":, "mtime":, "hashes": {"SHA256": ..., "CRC32": ...}, "verified": True/False/None}}
+# verified : civitai 의 파일 해시와 비교한 결과, 비교할 해시가 없었으면 None
+
+block_size = 1024 * 1024
+
+_cache = None
+_lock = threading.RLock()
+_batch_depth = 0
+_dirty = False
+
+class Crc32:
+    # hashlib 과 같은 방식으로 쓰기 위한 CRC32
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return f"{self.value & 0xFFFFFFFF:08x}"
+
+def new_hash(algorithm):
+    if algorithm == "SHA256":
+        return hashlib.sha256()
+    if algorithm == "CRC32":
+        return Crc32()
+    if algorithm == "BLAKE3" and blake3:
+        return blake3.blake3()
+    return None
+
+# setting.download_hashes 중에서 계산할수 있는 것, SHA256 은 항상 계산한다.
+def new_hashers() -> dict:
+    hashers = dict()
+    for algorithm in ["SHA256"] + [str(a).upper() for a in setting.download_hashes]:
+        if algorithm not in hashers:
+            hasher = new_hash(algorithm)
+            if hasher:
+                hashers[algorithm] = hasher
+    return hashers
+
+def update(hashers:dict, data):
+    for hasher in hashers.values():
+        hasher.update(data)
+
+def hexdigests(hashers:dict) -> dict:
+    return {algorithm: hasher.hexdigest() for algorithm, hasher in hashers.items()}
+
+# 파일의 start 부터 end 앞까지 읽어서 해시에 더한다.
+def update_from_file(hashers:dict, file_name, start, end):
+    if end <= start:
+        return
+
+    with open(file_name, "rb") as f:
+        f.seek(start)
+        remain = end - start
+        while remain > 0:
+            data = f.read(min(block_size, remain))
+            if not data:
+                raise EOFError(f"Unexpected end of file : {file_name}")
+            update(hashers, data)
+            remain = remain - len(data)
+
+# civitai 의 파일 해시(version_info['files'][i]['hashes'])와 비교한다.
+# 같은 종류의 해시가 하나도 없으면 None
+def verify(hashes:dict, expected:dict):
+    if not hashes or not expected:
+        return None
+
+    verified = None
+    for algorithm, value in hashes.items():
+        expected_value = expected.get(algorithm)
+        if not expected_value or not value:
+            continue
+        if str(expected_value).lower() != str(value).lower():
+            return False
+        verified = True
+
+    return verified
+
+def get_key(file_name):
+    return os.path.normcase(os.path.abspath(file_name))
+
+def get_stat(file_name):
+    try:
+        stat = os.stat(file_name)
+    except OSError:
+        return None, None
+    return stat.st_size, stat.st_mtime_ns
+
+def load() -> dict:
+    global _cache
+
+    with _lock:
+        if _cache is not None:
+            return _cache
+
+        _cache = dict()
+        try:
+            data = journal.read(setting.shortcut_hash_cache)
+            if data:
+                _cache = data
+        except Exception as e:
+            util.printD("Error when reading file:" + setting.shortcut_hash_cache)
+
+        return _cache
+
+def save():
+    global _dirty
+    
+    with _lock:
+        # batch() 안에서는 표시만 해두고 끝날때 한번만 쓴다.
+        if _batch_depth > 0:
+            _dirty = True
+            return
+        _dirty = False
+        journal.write_snapshot(setting.shortcut_hash_cache, load())
+
+# 여러 파일의 해시를 저장할때는 모아두었다가 끝날때 한번만 쓴다.
+#   with hashcache.batch():
+#       ...
+@contextlib.contextmanager
+def batch():
+    global _batch_depth
+    
+    with _lock:
+        _batch_depth = _batch_depth + 1
+        
+    try:
+        yield
+    finally:
+        with _lock:
+            _batch_depth = _batch_depth - 1
+            if _batch_depth == 0 and _dirty:
+                save()
+
+def get(file_name) -> dict:
+    with _lock:
+        entry = load().get(get_key(file_name))
+
+    if not entry:
+        return None
+
+    size, mtime = get_stat(file_name)
+    if size != entry.get("size") or mtime != entry.get("mtime"):
+        return None
+
+    return entry
+
+def put(file_name, hashes:dict, verified=None):
+    size, mtime = get_stat(file_name)
+    if size is None or not hashes:
+        return
+
+    with _lock:
+        load()[get_key(file_name)] = {
+            "size": size,
+            "mtime": mtime,
+            "hashes": {algorithm: str(value).lower() for algorithm, value in hashes.items()},
+            "verified": verified
+        }
+        save()
+
+def remove(file_name):
+    with _lock:
+        if load().pop(get_key(file_name), None) is not None:
+            save()
+
+# 저장된 SHA256 이 있으면 그것을, 없으면 계산해서 저장하고 돌려준다.
+def get_sha256(file_name):
+    entry = get(file_name)
+    if entry and entry["hashes"].get("SHA256"):
+        util.printD(f"sha256 (cached): {entry['hashes']['SHA256']}")
+        return entry["hashes"]["SHA256"]
+
+    sha256 = util.calculate_sha256(file_name)
+    if sha256:
+        put(file_name, {"SHA256": sha256})
+    return sha256
@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from . import util
+from . import setting
+from . import httpclient
+
+# civitai api(모델, 버전, 해시)의 응답을 url 단위로 sc_http_cache 폴더에 저장하는 캐시
+# 저장한지 setting.http_cache_ttl 초가 지나지 않았으면 요청하지 않고 저장된 내용을 돌려준다.
+# 지났으면 저장된 ETag / Last-Modified 로 조건부 요청을 보내 304 이면 저장된 내용을 다시 쓴다.
+# 캐시 파일 : {"url":..., "etag":..., "last_modified":..., "fetched":..., "data":...}
+
+_stats = {"hits": 0, "revalidated": 0, "misses": 0, "throttled": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+def count(name):
+    with _stats_lock:
+        _stats[name] = _stats[name] + 1
+
+def get_stats()->dict:
+    with _stats_lock:
+        stats = dict(_stats)
+
+    total = stats["hits"] + stats["revalidated"] + stats["misses"]
+    stats["hit_rate"] = (stats["hits"] + stats["revalidated"]) / total if total else 0.0
+    return stats
+
+def reset_stats():
+    with _stats_lock:
+        for k in _stats.keys():
+            _stats[k] = 0
+
+def cache_file(url):
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(setting.shortcut_http_cache_folder, key[:2], f"{key}.json")
+
+def read_entry(url):
+    path = cache_file(url)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path, 'r') as f:
+            entry = json.load(f)
+    except:
+        return None
+
+    if not entry or entry.get("url") != url:
+        return None
+
+    return entry
+
+def write_entry(url, entry:dict):
+    path = cache_file(url)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        util.printD("Error when writing file:" + path)
+
+# 다른 요청(모델 목록 등)으로 받은 내용을 url 의 응답으로 저장한다.
+# 검증 정보가 없으므로 TTL 이 지나면 다시 받는다.
+def put(url, data):
+    if not setting.http_cache_enable or data is None:
+        return
+
+    write_entry(url, {
+        "url": url,
+        "etag": None,
+        "last_modified": None,
+        "fetched": time.time(),
+        "data": data
+    })
+
+def remove(url):
+    try:
+        os.remove(cache_file(url))
+    except OSError:
+        pass
+
+def is_fresh(entry)->bool:
+    if setting.http_cache_ttl <= 0:
+        return False
+    return (time.time() - entry.get("fetched", 0)) < setting.http_cache_ttl
+
+# url 의 json 응답을 돌려준다. 실패하면 None, 요청이 제한되면 httpclient.Throttled
+# fresh=True 이면 저장된 내용이 TTL 안이라도 조건부 요청으로 다시 확인한다.
+def get_json(url, fresh=False):
+    if not setting.http_cache_enable:
+        return request_json(url)
+
+    entry = read_entry(url)
+    if entry and not fresh and is_fresh(entry):
+        count("hits")
+        return entry["data"]
+
+    headers = dict()
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        with httpclient.get(url, headers=headers) as response:
+            if response.status_code == 304 and entry:
+                count("revalidated")
+                entry["fetched"] = time.time()
+                write_entry(url, entry)
+                return entry["data"]
+
+            if response.status_code == 429:
+                count("throttled")
+                if entry:
+                    # 제한에 걸리면 오래된 내용이라도 돌려준다.
+                    return entry["data"]
+                return httpclient.Throttled(url, response.headers.get("Retry-After"))
+
+            if response.status_code != 200:
+                count("errors")
+                return None
+
+            data = response.json()
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+    except Exception as e:
+        count("errors")
+        return None
+
+    count("misses")
+    write_entry(url, {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched": time.time(),
+        "data": data
+    })
+    return data
+
+def request_json(url):
+    try:
+        with httpclient.get(url) as response:
+            if response.status_code == 429:
+                return httpclient.Throttled(url, response.headers.get("Retry-After"))
+            if response.status_code != 200:
+                return None
+            return response.json()
+    except Exception as e:
+        return None
@@ -0,0 +1,261 @@
+import time
+import threading
+import email.utils
+import urllib.parse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import util
+from . import setting
+
+# 모든 모듈이 같이 쓰는 http 클라이언트
+# 하나의 requests.Session 을 공유해서 호스트별로 연결을 재사용한다.(keep-alive)
+# 연결/응답 대기 시간을 정하고 5xx 응답과 연결 오류는 지수 백오프로 재시도한다.
+# 설정(setting.http_*)이 바뀌면 다음 요청에서 세션을 새로 만든다.
+#
+# civitai 로 가는 요청은 프로세스 전체가 같이 쓰는 제한을 거친다.
+#   - 토큰 버킷 : 초당 setting.http_rate_limit 개, 최대 setting.http_rate_burst 개까지 몰아서 보낸다.
+#   - 동시 요청 수 : 429 를 받으면 절반으로 줄이고, 성공이 이어지면 setting.http_max_concurrency 까지 하나씩 늘린다.
+#   - 429 의 Retry-After 동안은 모든 요청이 기다린 후 다시 시도한다.
+# 재시도 후에도 429 이면 응답을 그대로 돌려주고, 상위에서는 Throttled 로 알린다.
+# setting.offline_mode 이면 요청하지 않고 ConnectionError 를 낸다.
+
+retry_status_list = (500, 502, 503, 504)
+
+# 제한을 적용할 호스트, 이미지 서버(image.civitai.com)는 제외된다.
+rate_limited_hosts = ("civitai.com",)
+
+class Throttled:
+    # civitai 가 요청을 제한(429)해서 결과를 받지 못했을때 None 대신 돌려준다.
+    # None 과 같이 거짓으로 평가되므로 기존의 "if not result" 검사는 그대로 동작한다.
+    def __init__(self, url=None, retry_after=None):
+        self.url = url
+        self.retry_after = retry_after
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"Throttled(url={self.url!r}, retry_after={self.retry_after!r})"
+
+def is_throttled(result)->bool:
+    return isinstance(result, Throttled)
+
+_session = None
+_session_config = None
+_session_lock = threading.Lock()
+
+_tokens = None
+_tokens_time = 0
+_throttled_until = 0
+_limit_lock = threading.Lock()
+
+_concurrency = None
+_active = 0
+_success_count = 0
+_slot_cond = threading.Condition()
+
+def get_config():
+    return (setting.http_pool_maxsize, setting.http_max_retries, setting.http_backoff_factor)
+
+def make_retry(max_retries, backoff_factor):
+    kwargs = dict(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=retry_status_list,
+        # 429 와 Retry-After 는 request() 에서 프로세스 전체에 적용해서 처리한다.
+        respect_retry_after_header=False,
+        # 재시도가 끝나면 예외 대신 마지막 응답을 돌려준다. 상태 코드는 호출하는 쪽에서 확인한다.
+        raise_on_status=False,
+    )
+    try:
+        return Retry(allowed_methods=frozenset(["GET", "HEAD"]), **kwargs)
+    except TypeError:
+        # urllib3 1.26 이전
+        return Retry(method_whitelist=frozenset(["GET", "HEAD"]), **kwargs)
+
+def make_session(config):
+    pool_maxsize, max_retries, backoff_factor = config
+
+    adapter = HTTPAdapter(
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize,
+        max_retries=make_retry(max_retries, backoff_factor)
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session():
+    global _session
+    global _session_config
+
+    config = get_config()
+    with _session_lock:
+        if _session is None or _session_config != config:
+            old_session = _session
+            _session = make_session(config)
+            _session_config = config
+            if old_session:
+                try:
+                    old_session.close()
+                except Exception as e:
+                    util.printD(e)
+        return _session
+
+def get_timeout():
+    return (setting.http_connect_timeout, setting.http_read_timeout)
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def head(url, **kwargs):
+    kwargs.setdefault("allow_redirects", True)
+    return request("HEAD", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def request(method, url, **kwargs):
+    if setting.offline_mode:
+        raise requests.exceptions.ConnectionError(f"Offline mode : {url}")
+
+    kwargs.setdefault("timeout", get_timeout())
+    kwargs.setdefault("verify", False)
+    kwargs.setdefault("proxies", setting.proxies)
+
+    if not is_rate_limited(url):
+        return get_session().request(method, url, **kwargs)
+
+    attempt = 0
+    while True:
+        acquire_token()
+        acquire_slot()
+        throttled = False
+        try:
+            response = get_session().request(method, url, **kwargs)
+            throttled = response.status_code == 429
+        finally:
+            release_slot(throttled)
+
+        if not throttled or attempt >= setting.http_max_retries:
+            return response
+
+        retry_after = get_retry_after(response, attempt)
+        util.printD(f"Request throttled, retrying after {retry_after:.1f}s : {url}")
+        response.close()
+        throttle(retry_after)
+        attempt = attempt + 1
+
+def is_rate_limited(url)->bool:
+    try:
+        host = urllib.parse.urlsplit(url).hostname
+    except Exception as e:
+        return False
+    return host in rate_limited_hosts
+
+# Retry-After 는 초 또는 http 날짜로 온다. 없으면 지수 백오프를 쓴다.
+def get_retry_after(response, attempt=0)->float:
+    retry_after = None
+    value = response.headers.get("Retry-After") if response is not None else None
+    if value:
+        try:
+            retry_after = float(value)
+        except ValueError:
+            try:
+                retry_after = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+            except Exception as e:
+                retry_after = None
+
+    if retry_after is None:
+        retry_after = setting.http_backoff_factor * (2 ** attempt)
+
+    return min(max(retry_after, 1.0), 300.0)
+
+def throttle(seconds):
+    global _throttled_until
+
+    with _limit_lock:
+        _throttled_until = max(_throttled_until, time.monotonic() + seconds)
+
+def acquire_token():
+    global _tokens
+    global _tokens_time
+
+    while True:
+        with _limit_lock:
+            now = time.monotonic()
+            wait = _throttled_until - now
+            if wait <= 0:
+                if setting.http_rate_limit <= 0:
+                    return
+
+                burst = max(1, setting.http_rate_burst)
+                if _tokens is None:
+                    _tokens = burst
+                else:
+                    _tokens = min(burst, _tokens + (now - _tokens_time) * setting.http_rate_limit)
+                _tokens_time = now
+
+                if _tokens >= 1:
+                    _tokens = _tokens - 1
+                    return
+
+                wait = (1 - _tokens) / setting.http_rate_limit
+        time.sleep(wait)
+
+def get_concurrency()->int:
+    global _concurrency
+
+    if _concurrency is None or _concurrency > setting.http_max_concurrency:
+        _concurrency = max(1, setting.http_max_concurrency)
+    return _concurrency
+
+def acquire_slot():
+    global _active
+
+    with _slot_cond:
+        while _active >= get_concurrency():
+            _slot_cond.wait()
+        _active = _active + 1
+
+def release_slot(throttled=False):
+    global _active
+    global _concurrency
+    global _success_count
+
+    with _slot_cond:
+        _active = _active - 1
+        if throttled:
+            _concurrency = max(1, get_concurrency() // 2)
+            _success_count = 0
+        else:
+            _success_count = _success_count + 1
+            if _success_count >= get_concurrency() * 4:
+                _concurrency = min(setting.http_max_concurrency, get_concurrency() + 1)
+                _success_count = 0
+        _slot_cond.notify_all()
+
+def get_limiter_state()->dict:
+    with _slot_cond:
+        return {
+            "concurrency": get_concurrency(),
+            "active": _active,
+            "throttled_for": max(0.0, _throttled_until - time.monotonic())
+        }
+
+def close():
+    global _session
+    global _session_config
+
+    with _session_lock:
+        if _session:
+            _session.close()
+        _session = None
+        _session_config = None
@@ -1,16 +1,27 @@
 import os
+import copy
 import json
 import shutil
-import requests
 import gradio as gr
 import datetime
+import time
+import threading
+import concurrent.futures
+import types
+import collections
+import contextlib
 
 from tqdm import tqdm
 
 from . import util
 from . import setting
+from . import httpclient
 from . import civitai
 from . import classification
+from . import ishortcut_db
+from . import journal
+from . import storelock
+from . import resolver
 
 from PIL import Image
 
@@ -27,7 +38,7 @@ def sort_shortcut_by_modelid(ISC, reverse=False):
     return sorted_data
 
 def get_tags():
-    ISC = load()
+    ISC = load_view()
     if not ISC:
         return  
       
@@ -62,6 +73,12 @@ def get_latest_version_info_by_model_id(id:str) -> dict:
 
 def get_model_filenames(modelid:str):
     
+    ISC = load_view()
+    if ISC and str(modelid) in ISC:
+        summary = ISC[str(modelid)].get("summary")
+        if summary:
+            return list(summary["files"])
+        
     model_info = get_model_info(modelid)    
     if not model_info:
         return None
@@ -77,6 +94,13 @@ def get_model_filenames(modelid:str):
 
 def is_baseModel(modelid:str, baseModels):
     
+    # 숏컷에 요약 정보가 있으면 모델 정보 파일을 읽지 않는다.
+    ISC = load_view()
+    if ISC and str(modelid) in ISC:
+        summary = ISC[str(modelid)].get("summary")
+        if summary:
+            return bool(set(summary["baseModels"]) & set(baseModels))
+        
     model_info = get_model_info(modelid)    
     if not model_info:
         return None
@@ -92,11 +116,100 @@ def is_baseModel(modelid:str, baseModels):
 
     return False
 
+# 필터링에 필요한 모델 정보를 요약하여 숏컷에 함께 저장한다.
+def make_model_summary(model_info:dict)->dict:
+    if not model_info:
+        return None
+    
+    summary = {
+        "baseModels" : list(),
+        "versions" : list(),
+        "files" : list(),
+        "trainedWords" : list()
+    }
+    
+    if "modelVersions" in model_info.keys():
+        for ver in model_info["modelVersions"]:
+            if "id" in ver.keys():
+                summary["versions"].append(str(ver["id"]))
+                
+            if "baseModel" in ver.keys() and ver["baseModel"]:
+                if ver["baseModel"] not in summary["baseModels"]:
+                    summary["baseModels"].append(ver["baseModel"])
+                    
+            if "files" in ver.keys():
+                for ver_file in ver["files"]:
+                    if "name" in ver_file.keys():
+                        summary["files"].append(ver_file["name"])
+                        
+            if "trainedWords" in ver.keys() and ver["trainedWords"]:
+                for word in ver["trainedWords"]:
+                    if word not in summary["trainedWords"]:
+                        summary["trainedWords"].append(word)
+                        
+    return summary
+
+# 등록된 숏컷의 요약 정보를 갱신한다. 바뀐 것이 있을때만 저장한다.
+# refreshed=True 이면 civitai 에서 새로 받은 정보이므로 last_refreshed 도 기록한다.
+def update_model_summaries(summaries:dict, refreshed=False):
+    if not summaries:
+        return
+    
+    ISC = load_view()
+    if not ISC:
+        return
+    
+    if not refreshed and not [k for k, v in summaries.items() if v and str(k) in ISC and ISC[str(k)].get("summary") != v]:
+        return
+    
+    last_refreshed = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with store_lock():
+        ISC = load()
+        if not ISC:
+            return
+        
+        changed = False
+        for modelid, summary in summaries.items():
+            if summary and str(modelid) in ISC:
+                if ISC[str(modelid)].get("summary") != summary:
+                    ISC[str(modelid)]["summary"] = summary
+                    changed = True
+                if refreshed:
+                    ISC[str(modelid)]["last_refreshed"] = last_refreshed
+                    changed = True
+                    
+        if changed:
+            save(ISC)
+
+# 반환된 모델 정보는 캐시와 공유되므로 수정하지 않는다.
 def get_model_info(modelid:str):
+    global _model_info_cache_bytes, _model_info_cache_hits, _model_info_cache_misses
+    
     if not modelid:
         return    
+    
+    modelid = str(modelid)
     contents = None    
     model_path = os.path.join(setting.shortcut_info_folder, modelid, f"{modelid}{setting.info_suffix}{setting.info_ext}")       
+    
+    try:
+        st = os.stat(model_path)
+        stat = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        with _model_info_cache_lock:
+            drop_model_info_cache(modelid)
+        return None
+        
+    with _model_info_cache_lock:
+        if modelid in _model_info_cache:
+            cached_stat, contents = _model_info_cache[modelid]
+            if cached_stat == stat:
+                _model_info_cache.move_to_end(modelid)
+                _model_info_cache_hits = _model_info_cache_hits + 1
+                return contents
+            drop_model_info_cache(modelid)
+        _model_info_cache_misses = _model_info_cache_misses + 1
+        
     try:
         with open(model_path, 'r') as f:
             contents = json.load(f)            
@@ -106,6 +219,15 @@ def get_model_info(modelid:str):
     except:
         return None
     
+    with _model_info_cache_lock:
+        drop_model_info_cache(modelid)
+        _model_info_cache[modelid] = (stat, contents)
+        _model_info_cache_bytes = _model_info_cache_bytes + stat[1]
+        
+        # 지정한 개수나 크기를 넘으면 가장 오래전에 사용한 것부터 버린다.
+        while len(_model_info_cache) > 1 and (len(_model_info_cache) > setting.model_info_cache_max_items or _model_info_cache_bytes > setting.model_info_cache_max_bytes):
+            drop_model_info_cache(next(iter(_model_info_cache)))
+            
     return contents
 
 def get_version_info(modelid:str, versionid:str):
@@ -157,18 +279,27 @@ def get_images_meta(images:dict, imageid):
 
 # 모델에 해당하는 shortcut에서 note를 변경한다.
 def update_shortcut_model_note(modelid, note):
-    if modelid:
-        ISC = load()            
-        try:           
-            ISC[str(modelid)]["note"] = str(note)
-            save(ISC)
-        except:
-            pass
+    with store_lock():
+        if modelid:
+            if setting.shortcut_storage == "sqlite":
+                cis = ishortcut_db.get(modelid)
+                if cis:
+                    cis["note"] = str(note)
+                    ishortcut_db.upsert(modelid, cis)
+                    invalidate_cache()
+                return
+        
+            ISC = load()            
+            try:           
+                ISC[str(modelid)]["note"] = str(note)
+                save(ISC)
+            except:
+                pass
         
 # 모델에 해당하는 shortcut에서 note를 가져온다
 def get_shortcut_model_note(modelid):
     if modelid:
-        ISC = load()            
+        ISC = load_view()            
         try:           
             return ISC[str(modelid)]["note"]
         except:
@@ -178,126 +309,215 @@ def get_shortcut_model_note(modelid):
 # 모델에 해당하는 shortcut 을 가져온다
 def get_shortcut_model(modelid):
     if modelid:
-        ISC = load()            
+        ISC = load_view()            
         try:           
-            return ISC[str(modelid)]
+            return dict(ISC[str(modelid)])
         except:
             pass
     return None
         
 # 모델에 해당하는 shortcut 을 지운다
 def delete_shortcut_model(modelid):
-    if modelid:
-        ISC = load()                           
-        ISC = delete(ISC, modelid)
-        save(ISC) 
+    with store_lock():
+        if modelid:
+            if setting.shortcut_storage == "sqlite":
+                cis = ishortcut_db.get(modelid)
+                if cis:
+                    delete({str(modelid): cis}, modelid)
+                    ishortcut_db.remove(modelid)
+                    invalidate_cache()
+                return
+        
+            ISC = load()                           
+            ISC = delete(ISC, modelid)
+            save(ISC) 
+        
+# 새로 받아온 숏컷에 기존 숏컷의 개별 정보(note, date, nsfw)를 병합한다.
+def merge_shortcut(ISC:dict, add_ISC:dict, modelid):
+    if not add_ISC:
+        add_ISC = dict()
+        
+    if ISC and str(modelid) in ISC:
+        note = None
+        date = datetime.datetime.now()
+        date = date.strftime("%Y-%m-%d %H:%M:%S")
+        
+        #만일 civitai 에서 정보를 가져올수 없다면 기존것을 그대로 사용한다.
+        if str(modelid) not in add_ISC:
+            add_ISC[str(modelid)] = ISC[str(modelid)]
+
+        # 기존의 개별적으로 저장한 정보를 가져온다.
+        if "note" in ISC[str(modelid)]:
+            note = ISC[str(modelid)]["note"]                                    
+
+        # 기존의 등록날짜 정보를 가져온다.
+        if "date" in ISC[str(modelid)]:
+            if ISC[str(modelid)]["date"]:
+                date = ISC[str(modelid)]["date"]
         
+        add_ISC[str(modelid)]["note"] = str(note)
+        add_ISC[str(modelid)]["date"] = date
+        
+        if 'nsfw' not in add_ISC[str(modelid)].keys():
+            add_ISC[str(modelid)]["nsfw"] = False
+            
+    return add_ISC
+
+# 갱신된 숏컷들을 현재 저장된 숏컷에 병합하여 한번에 저장한다.
+# 작업중에 다른 곳에서 변경된 내용(note 등)을 잃지 않도록 저장 직전에 다시 읽는다.
+def commit_shortcuts(refreshed_ISC:dict):
+    if not refreshed_ISC:
+        return
+    
+    with store_lock():
+        ISC = load()
+        if not ISC:
+            ISC = dict()
+        
+        for modelid, cis in refreshed_ISC.items():
+            ISC.update(merge_shortcut(ISC, {modelid: cis}, modelid))
+        
+        save(ISC)
+    
 # 이중으로 하지 않으면 gr.Progress 오류가 난다 아마도 중첩에서 에러가 나는것 같다. progress.tqdm
 # 솟컷을 업데이트하며 없으면 해당 아이디의 모델을 새로 생성한다.
 def update_shortcut(modelid, progress = None):
     if modelid:
-        note = None
-        date = datetime.datetime.now()
-        date = date.strftime("%Y-%m-%d %H:%M:%S")
-                            
         add_ISC = add(None, str(modelid), False, progress)
-        ISC = load()
-        if ISC:
-            if str(modelid) in ISC:
-                                
-                #만일 civitai 에서 정보를 가져올수 없다면 기존것을 그대로 사용한다.
-                if str(modelid) not in add_ISC:
-                    add_ISC[str(modelid)] = ISC[str(modelid)]
-
-                # 기존의 개별적으로 저장한 정보를 가져온다.
-                if "note" in ISC[str(modelid)]:
-                    note = ISC[str(modelid)]["note"]                                    
-
-                # 기존의 등록날짜 정보를 가져온다.
-                if "date" in ISC[str(modelid)]:
-                    if ISC[str(modelid)]["date"]:
-                        date = ISC[str(modelid)]["date"]
-                
-                add_ISC[str(modelid)]["note"] = str(note)
-                add_ISC[str(modelid)]["date"] = date
+        if add_ISC:
+            commit_shortcuts(add_ISC)
+
+# 여러 숏컷을 갱신하며 모아서 한번에 저장한다.
+# 작업이 중단되어도 손실을 줄이기 위해 setting.shortcut_update_checkpoint 개 마다 중간 저장한다.
+def update_shortcuts(modelid_list:list, progress=None, desc="Updating Shortcut"):
+    if not modelid_list:       
+        return
+    
+    refreshed_ISC = dict()
+    count = 0
+    
+    modelid_list = [modelid for modelid in modelid_list if modelid]
+    model_infos = civitai.get_model_infos(modelid_list)
+    
+    def refresh(modelid):
+        return add(None, str(modelid), False, None, model_infos.get(str(modelid)))
+    
+    with backup_batch():
+        for modelid, add_ISC in run_concurrent(refresh, modelid_list, progress, desc):
+            if add_ISC:
+                refreshed_ISC.update(add_ISC)
+            
+            count = count + 1
+            if setting.shortcut_update_checkpoint > 0 and count % setting.shortcut_update_checkpoint == 0:
+                commit_shortcuts(refreshed_ISC)
+                refreshed_ISC = dict()
                 
-                if 'nsfw' not in add_ISC[str(modelid)].keys():
-                    add_ISC[str(modelid)]["nsfw"] = False
-                    
-            ISC.update(add_ISC)
-        else:
-            ISC = add_ISC
-        save(ISC)
+        commit_shortcuts(refreshed_ISC)
         
 def update_shortcut_models(modelid_list:list, progress):
-    if not modelid_list:       
-        return
-      
-    for k in progress.tqdm(modelid_list, desc="Updating Shortcut"):        
-        update_shortcut(k, progress)
+    update_shortcuts(modelid_list, progress, "Updating Shortcut")
     
 def update_shortcut_informations(modelid_list:list, progress):
-    if not modelid_list:
-        return 
-    
     # shortcut 의 데이터만 새로 갱신한다.    
     # for modelid in progress.tqdm(modelid_list, desc="Updating Shortcut Information"):
     #     write_model_information(modelid, False, progress) 
 
-    for modelid in progress.tqdm(modelid_list,desc="Updating Models Information"):        
-        if modelid:                
-            note = None
-            date = datetime.datetime.now()
-            date = date.strftime("%Y-%m-%d %H:%M:%S")
-            add_ISC = add(None,str(modelid),False,progress)
-
-            ISC = load()
-
-            if str(modelid) in ISC:
-                
-                #만일 civitai 에서 정보를 가져올수 없다면 기존것을 그대로 사용한다.
-                if str(modelid) not in add_ISC:
-                    add_ISC[str(modelid)] = ISC[str(modelid)]
-                                    
-                # 개별적으로 저장한 정보를 가져온다.
-                if "note" in ISC[str(modelid)]:
-                    note = ISC[str(modelid)]["note"]
-
-                # 기존의 등록날짜 정보를 가져온다.
-                if "date" in ISC[str(modelid)]:
-                    if ISC[str(modelid)]["date"]:
-                        date = ISC[str(modelid)]["date"]
-                    
-                add_ISC[str(modelid)]["note"] = str(note)
-                add_ISC[str(modelid)]["date"] = date
-
-                if 'nsfw' not in add_ISC[str(modelid)].keys():
-                    add_ISC[str(modelid)]["nsfw"] = False
-                    
-                # hot fix and delete model
-                # civitiai 에서 제거된 모델때문임
-                # tags 를 변경해줘야함
-                # 이슈가 해결되면 제거할코드
-                # ISC[str(modelid)]["tags"]=[]
-                
-            if ISC:
-                ISC.update(add_ISC)
-            else:
-                ISC = add_ISC
-            save(ISC)
+    # hot fix and delete model
+    # civitiai 에서 제거된 모델때문임
+    # tags 를 변경해줘야함
+    # 이슈가 해결되면 제거할코드
+    # ISC[str(modelid)]["tags"]=[]
+    
+    update_shortcuts(modelid_list, progress, "Updating Models Information")
                             
 def update_all_shortcut_informations(progress):
-    preISC = load()                           
+    preISC = load_view()                           
     if not preISC:
         return
     
     modelid_list = [k for k in preISC]
     update_shortcut_informations(modelid_list, progress)
             
-def write_model_information(modelid:str, register_only_information=False, progress=None):    
+# 여러 모델의 정보(sc_infos)를 동시에 새로 받는다. 성공한 모델의 수를 돌려준다.
+def refresh_model_informations(modelid_list:list, register_only_information=False, progress=None, desc="Updating Models Information")->int:
+    if not modelid_list:
+        return 0
+    
+    modelid_list = [modelid for modelid in modelid_list if modelid]
+    model_infos = civitai.get_model_infos(modelid_list)
+    
+    def refresh(modelid):
+        return write_model_information(str(modelid), register_only_information, None, model_infos.get(str(modelid)))
+    
+    # 숏컷의 요약 정보와 last_refreshed 는 모아서 한번에 저장한다.
+    summaries = dict()
+    count = 0
+    throttled = 0
+    for modelid, model_info in run_concurrent(refresh, modelid_list, progress, desc):
+        if model_info:
+            summaries[str(modelid)] = make_model_summary(model_info)
+            count = count + 1
+            if setting.shortcut_update_checkpoint > 0 and count % setting.shortcut_update_checkpoint == 0:
+                update_model_summaries(summaries, True)
+                summaries = dict()
+        elif civitai.is_throttled(model_info):
+            throttled = throttled + 1
+    
+    update_model_summaries(summaries, True)
+            
+    if throttled > 0:
+        # 제한에 걸린 모델은 이전 정보를 그대로 둔다.
+        util.printD(f"{throttled} models were throttled and kept their previous information")
+    return count
+
+# items 각각에 대해 func 를 setting.shortcut_update_workers 개의 작업자로 동시에 실행하고
+# 끝나는 순서대로 (item, 결과) 를 돌려준다.
+# 한 항목에서 오류가 나면 결과는 None 이 되고 나머지 항목은 계속 처리한다.
+# rate_limit=False 이면 setting.shortcut_update_rate_limit 를 적용하지 않는다.(civitai 요청 제한은 그대로 적용된다)
+def run_concurrent(func, items:list, progress=None, desc=None, rate_limit=True):
+    if not items:
+        return
+    
+    def run(item):
+        if rate_limit:
+            wait_refresh_rate()
+        try:
+            return func(item)
+        except Exception as e:
+            util.printD(f"Error while updating {item} : {e}")
+            return None
+    
+    workers = max(1, min(setting.shortcut_update_workers, len(items)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, item): item for item in items}
+        completed = concurrent.futures.as_completed(futures)
+        if progress:
+            completed = progress.tqdm(completed, total=len(futures), desc=desc)
+        for future in completed:
+            yield futures[future], future.result()
+
+# 모든 작업자가 같이 쓰는 속도 제한, 초당 setting.shortcut_update_rate_limit 개까지만 시작한다.
+def wait_refresh_rate():
+    global _refresh_next_time
+    
+    if setting.shortcut_update_rate_limit <= 0:
+        return
+    
+    interval = 1.0 / setting.shortcut_update_rate_limit
+    with _refresh_rate_lock:
+        now = time.monotonic()
+        start = max(now, _refresh_next_time)
+        _refresh_next_time = start + interval
+        
+    if start > now:
+        time.sleep(start - now)
+
+# model_info 를 주면 새로 요청하지 않고 그 정보를 저장한다.(civitai.get_model_infos 로 미리 받은 경우)
+def write_model_information(modelid:str, register_only_information=False, progress=None, model_info=None):    
     if not modelid:
         return     
-    model_info = civitai.get_model_info(modelid)
+    if model_info is None:
+        model_info = civitai.get_model_info(modelid)
     if model_info:
         version_list = list()
         if "modelVersions" in model_info.keys():
@@ -326,7 +546,7 @@ def write_model_information(modelid:str, register_only_information=False, progre
         
         try:            
             # model info 저장            
-            tmp_info_file = os.path.join(model_path, f"tmp{setting.info_suffix}{setting.info_ext}")
+            tmp_info_file = os.path.join(model_path, f"tmp-{os.getpid()}-{threading.get_ident()}{setting.info_suffix}{setting.info_ext}")
             model_info_file = os.path.join(model_path, f"{modelid}{setting.info_suffix}{setting.info_ext}")            
             with open(tmp_info_file, 'w') as f:
                 f.write(json.dumps(model_info, indent=4))
@@ -353,7 +573,7 @@ def write_model_information(modelid:str, register_only_information=False, progre
                                 dn_count = dn_count + 1
                                 continue
                                 
-                            with requests.get(url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+                            with httpclient.get(url, stream=True) as img_r:
                                 if not img_r.ok:
                                     util.printD("Get error code: " + str(img_r.status_code) + ": proceed to the next file")
                                     continue
@@ -383,7 +603,7 @@ def write_model_information(modelid:str, register_only_information=False, progre
                                 dn_count = dn_count + 1
                                 continue
                             
-                            with requests.get(url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+                            with httpclient.get(url, stream=True) as img_r:
                                 if not img_r.ok:
                                     util.printD("Get error code: " + str(img_r.status_code) + ": proceed to the next file")
                                     continue
@@ -416,8 +636,8 @@ def update_thumbnail_images(progress):
     
     for k, v in progress.tqdm(preISC.items(),desc="Update Shortcut's Thumbnails"):
         if v:
-            # 사이트에서 최신 정보를 가져온다.
-            version_info = civitai.get_latest_version_info_by_model_id(v['id'])
+            # 최신 정보를 가져온다. 로컬 정보가 오래되지 않았으면 그대로 쓴다.
+            version_info = resolver.get_latest_version_info(v['id'])
             if not version_info:
                 continue
             
@@ -443,17 +663,20 @@ def update_thumbnail_images(progress):
                 v['imageurl'] = def_image                                        
                 download_thumbnail_image(v['id'], v['imageurl'])
                 
-    # 중간에 변동이 있을수 있으므로 병합한다.                
-    ISC = load()
-    if ISC:
-        ISC.update(preISC)
-    else:
-        ISC = preISC            
-    save(ISC)
+    # 중간에 변동이 있을수 있으므로 바뀐 이미지 주소만 병합한다.                
+    with store_lock():
+        ISC = load()
+        if not ISC:
+            return
+        
+        for k, v in preISC.items():
+            if v and k in ISC and 'imageurl' in v:
+                ISC[k]['imageurl'] = v['imageurl']
+        save(ISC)
     
 def get_list(shortcut_types=None)->str:
     
-    ISC = load()                           
+    ISC = load_view()                           
     if not ISC:
         return
     
@@ -479,7 +702,7 @@ def get_list(shortcut_types=None)->str:
 
 def get_image_list(shortcut_types=None, search=None, shortcut_basemodels=None, shortcut_classification=None)->str:
     
-    ISC = load()
+    ISC = load_view()
     if not ISC:
         return
     
@@ -490,27 +713,10 @@ def get_image_list(shortcut_types=None, search=None, shortcut_basemodels=None, s
     
     # classification # and 연산으로 변경한다.  
     if shortcut_classification:        
-        clfs_list = list()
-        CISC = classification.load()
-        if CISC:
-            for name in shortcut_classification:
-                name_list = classification.get_shortcut_list(CISC,name)
-                if name_list:
-                    if len(clfs_list) > 0:
-                        clfs_list = list(set(clfs_list) & set(name_list))
-                    else:
-                        clfs_list = name_list
-                else:
-                    clfs_list = list()
-                    # 결과가 없다면 교집합으로 나올수 있는것이 없으므로 
-                    break
-                    
-            clfs_list = list(set(clfs_list))
-            
-        if len(clfs_list) > 0:
-            for mid in clfs_list:
-                if str(mid) in ISC.keys():
-                    result_list.append(ISC[str(mid)])
+        clfs_list = classification.get_shortcuts_intersection(shortcut_classification)
+        for mid in clfs_list:
+            if str(mid) in ISC.keys():
+                result_list.append(ISC[str(mid)])
     else:
         result_list = ISC.values()
             
@@ -572,7 +778,22 @@ def get_image_list(shortcut_types=None, search=None, shortcut_basemodels=None, s
     tmp_basemodels = list()
     if shortcut_basemodels:
         tmp_basemodels.extend(shortcut_basemodels)
-        result_list = [v for v in result_list if is_baseModel(str(v['id']), tmp_basemodels)]        
+        
+        # 요약 정보가 없는 예전 숏컷은 한번만 모델 정보에서 만들어 저장한다.
+        missing_summaries = dict()
+        for v in result_list:
+            if not v.get("summary"):
+                summary = make_model_summary(get_model_info(str(v['id'])))
+                if summary:
+                    missing_summaries[str(v['id'])] = summary
+        update_model_summaries(missing_summaries)
+        
+        basemodel_list = list()
+        for v in result_list:
+            summary = v.get("summary") or missing_summaries.get(str(v['id']))
+            if summary and set(summary["baseModels"]) & set(tmp_basemodels):
+                basemodel_list.append(v)
+        result_list = basemodel_list
             
     # filename검색
     # if filenames:
@@ -623,7 +844,7 @@ def download_thumbnail_image_old(model_id, url):
     
     try:
         # get image
-        with requests.get(url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+        with httpclient.get(url, stream=True) as img_r:
             if not img_r.ok:
                 return False
             
@@ -648,7 +869,7 @@ def download_thumbnail_image(model_id, url):
     
     try:
         # Get image
-        with requests.get(url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+        with httpclient.get(url, stream=True) as img_r:
             if not img_r.ok:
                 return False
 
@@ -673,7 +894,7 @@ def is_sc_image(model_id):
     
     return False        
 
-def add(ISC:dict, model_id, register_information_only=False, progress=None)->dict:
+def add(ISC:dict, model_id, register_information_only=False, progress=None, model_info=None)->dict:
 
     if not model_id:
         return ISC   
@@ -681,7 +902,7 @@ def add(ISC:dict, model_id, register_information_only=False, progress=None)->dic
     if not ISC:
         ISC = dict()
     
-    model_info = write_model_information(model_id, register_information_only, progress)    
+    model_info = write_model_information(model_id, register_information_only, progress, model_info)    
     
     def_id = None
     def_image = None
@@ -734,7 +955,9 @@ def add(ISC:dict, model_id, register_information_only=False, progress=None)->dic
                 "versionid" : def_id,
                 "imageurl" : def_image,
                 "note" : "",
-                "date" : date.strftime("%Y-%m-%d %H:%M:%S")
+                "date" : date.strftime("%Y-%m-%d %H:%M:%S"),
+                "summary" : make_model_summary(model_info),
+                "last_refreshed" : date.strftime("%Y-%m-%d %H:%M:%S")
         }
         
         cis_to_file(ISC[str(model_id)])
@@ -779,54 +1002,124 @@ def backup_cis(name, url):
     if not name or not url:
         return
 
-    backup_dict = None
-    try:
-        with open(setting.shortcut_civitai_internet_shortcut_url, 'r') as f:
-            backup_dict = json.load(f)            
-    except:
-        backup_dict = dict()
+    with _backup_lock:
+        if _backup_buffer is not None:
+            _backup_buffer[f"url={url}"] = name
+            return
+        
+    write_backup({f"url={url}": name})
+
+# 여러 숏컷을 등록/삭제할때는 백업 내용을 모아두었다가 끝날때 한번만 쓴다.
+#   with ishortcut.backup_batch():
+#       ...
+@contextlib.contextmanager
+def backup_batch():
+    global _backup_buffer, _backup_depth
     
-    backup_dict[f"url={url}"] = name
+    with _backup_lock:
+        if _backup_buffer is None:
+            _backup_buffer = dict()
+        _backup_depth = _backup_depth + 1
+        
+    try:
+        yield
+    finally:
+        entries = None
+        with _backup_lock:
+            _backup_depth = _backup_depth - 1
+            if _backup_depth == 0:
+                entries = _backup_buffer
+                _backup_buffer = None
+                
+        if entries:
+            write_backup(entries)
             
-    try:        
-        with open(setting.shortcut_civitai_internet_shortcut_url, 'w') as f:
-            json.dump(backup_dict, f, indent=4)
-    except Exception as e:
-        util.printD("Error when writing file:" + setting.shortcut_civitai_internet_shortcut_url)
-        pass
+# 쓰기 직전에 파일을 다시 읽어 병합하므로 다른 곳에서 쓴 내용을 덮어쓰지 않는다.
+# 다른 프로세스와도 같이 쓸수 있도록 파일 잠금을 잡고, 임시 파일은 프로세스/스레드마다 따로 만든다.
+def write_backup(entries:dict):
+    if not entries:
+        return
+    
+    with storelock.lock(setting.shortcut_civitai_internet_shortcut_url):
+        backup_dict = None
+        try:
+            with open(setting.shortcut_civitai_internet_shortcut_url, 'r') as f:
+                backup_dict = json.load(f)            
+        except:
+            backup_dict = dict()
+        
+        backup_dict.update(entries)
+                
+        try:        
+            tmp_path = f"{setting.shortcut_civitai_internet_shortcut_url}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_path, 'w') as f:
+                json.dump(backup_dict, f, indent=4)
+            os.replace(tmp_path, setting.shortcut_civitai_internet_shortcut_url)
+        except Exception as e:
+            util.printD("Error when writing file:" + setting.shortcut_civitai_internet_shortcut_url)
+            pass
  
+# 읽고 수정해서 저장하는 쪽은 store_lock 을 잡은채로 load 와 save 를 해야 다른 곳의 변경을 덮어쓰지 않는다.
 def save(ISC:dict):
-    #print("Saving Civitai Internet Shortcut to: " + setting.shortcut)
+    with store_lock():
+        #print("Saving Civitai Internet Shortcut to: " + setting.shortcut)
 
-    output = ""
+        output = ""
     
-    #write to file
-    try:
-        with open(setting.shortcut, 'w') as f:
-            json.dump(ISC, f, indent=4)
-    except Exception as e:
-        util.printD("Error when writing file:"+setting.shortcut)
-        return output
+        if setting.shortcut_storage == "sqlite":
+            # 캐시와 비교해서 바뀐 행만 쓴다.
+            changed = [record["key"] for record in journal.diff(get_cache(), ISC)]
+            if not ishortcut_db.save(ISC, changed):
+                invalidate_cache()
+                return output
+            set_cache(ISC)
+            return "Civitai Internet Shortcut saved to: " + setting.shortcut_db
+    
+        # 저장되어 있는 내용과 비교하여 바뀐 부분만 journal 에 기록한다.
+        old_ISC = get_cache() if os.path.isfile(setting.shortcut) else None
+    
+        #write to file
+        if not journal.write(setting.shortcut, ISC, old_ISC):
+            invalidate_cache()
+            return output
 
-    output = "Civitai Internet Shortcut saved to: " + setting.shortcut
-    #util.printD(output)
+        set_cache(ISC)
+    
+        output = "Civitai Internet Shortcut saved to: " + setting.shortcut
+        #util.printD(output)
 
-    return output
+        return output
 
+# 수정해서 save 할 목적이면 load 를, 읽기만 할 목적이면 load_view 를 사용한다.
+# load 는 캐시의 복사본을 돌려주므로 수정해도 캐시에 영향이 없다.
 def load()->dict:
     #util.printD("Load Civitai Internet Shortcut from: " + setting.shortcut)
 
-    if not os.path.isfile(setting.shortcut):        
+    ISC = get_cache()
+    if not ISC:
+        return None
+    
+    return copy.deepcopy(ISC)
+
+# 읽기 전용 뷰를 돌려준다. 파일이 바뀌지 않았다면 디스크를 읽지 않는다.
+def load_view():
+    get_cache()
+    return _ISC_view
+
+def read_file()->dict:
+    if setting.shortcut_storage == "sqlite":
+        json_data = ishortcut_db.load()
+        if not json_data:
+            util.printD("There are no registered shortcuts.")
+            return None
+        return json_data
+    
+    if not os.path.isfile(setting.shortcut) and not os.path.isfile(journal.journal_path(setting.shortcut)):
         util.printD("Unable to load the shortcut file. Starting with an empty file.")
         save({})
         return
     
-    json_data = None
-    try:
-        with open(setting.shortcut, 'r') as f:
-            json_data = json.load(f)
-    except:
-        return None            
+    json_data = journal.read(setting.shortcut)
 
     # check error
     if not json_data:
@@ -835,3 +1128,157 @@ def load()->dict:
 
     # check for new key
     return json_data
+
+# 여러 모델을 동시에 갱신할때의 속도 제한
+_refresh_next_time = 0
+_refresh_rate_lock = threading.Lock()
+
+#=========================================================
+#================= backup ================================
+
+_backup_buffer = None
+_backup_depth = 0
+_backup_lock = threading.RLock()
+
+#=========================================================
+#================= cache =================================
+# 모든 호출자가 공유하는 숏컷 캐시
+# 파일의 mtime/size 가 바뀌거나 save 를 통해 쓸때만 갱신된다.
+
+_ISC_cache = None
+_ISC_view = None
+_ISC_stat = None
+_ISC_lock = threading.RLock()
+
+def stat_file():
+    if setting.shortcut_storage == "sqlite":
+        paths = (setting.shortcut_db, f"{setting.shortcut_db}-wal")
+    else:
+        paths = (setting.shortcut, journal.journal_path(setting.shortcut))
+        
+    result = list()
+    for path in paths:
+        try:
+            st = os.stat(path)
+            result.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            result.append(None)
+            
+    return (setting.shortcut_storage, tuple(result))
+
+def make_view(ISC:dict):
+    if not ISC:
+        return None
+    return types.MappingProxyType({k: types.MappingProxyType(v) if isinstance(v, dict) else v for k, v in ISC.items()})
+
+def set_cache(ISC:dict):
+    global _ISC_cache, _ISC_view, _ISC_stat
+
+    with _ISC_lock:
+        if ISC:
+            # 저장한 쪽이 계속 수정할수 있으므로 캐시는 따로 복사해 둔다.
+            _ISC_cache = copy.deepcopy(ISC)
+        else:
+            _ISC_cache = None
+        _ISC_view = make_view(_ISC_cache)
+        _ISC_stat = stat_file()
+
+def invalidate_cache():
+    global _ISC_stat
+
+    with _ISC_lock:
+        _ISC_stat = None
+
+def get_cache()->dict:
+    with _ISC_lock:
+        if _ISC_stat is not None and _ISC_stat == stat_file():
+            return _ISC_cache
+
+    # 파일 잠금을 먼저 잡고 캐시 잠금을 잡는다.
+    with store_lock():
+        with _ISC_lock:
+            if _ISC_stat is not None and _ISC_stat == stat_file():
+                return _ISC_cache
+            
+            try:
+                ISC = read_file()
+            except Exception as e:
+                # 읽지 못했다면 마지막으로 읽은 내용을 그대로 사용한다.
+                util.printD("Error when reading file:" + setting.shortcut)
+                return _ISC_cache
+            
+            set_cache(ISC)
+            return _ISC_cache
+
+# 숏컷 저장소를 읽고 수정해서 저장하는 동안 다른 스레드/프로세스가 끼어들지 못하게 한다.
+#   with ishortcut.store_lock():
+#       ISC = ishortcut.load()
+#       ...
+#       ishortcut.save(ISC)
+def store_lock():
+    if setting.shortcut_storage == "sqlite":
+        return storelock.lock(setting.shortcut_db)
+    return storelock.lock(setting.shortcut)
+#=========================================================
+
+# 숏컷 데이터를 기존 형식의 json 파일로 내보낸다.
+def export_json(path=None):
+    if not path:
+        path = setting.shortcut
+        
+    if setting.shortcut_storage == "sqlite":
+        return ishortcut_db.export_json(path)
+    
+    # journal 을 스냅샷에 합친다.
+    if path == setting.shortcut:
+        return journal.compact(path)
+    
+    ISC = load()
+    if not ISC:
+        ISC = dict()
+        
+    try:
+        with open(path, 'w') as f:
+            json.dump(ISC, f, indent=4)
+    except Exception as e:
+        util.printD("Error when writing file:" + path)
+        return False
+    
+    return True
+
+#=========================================================
+#================= model info cache ======================
+# sc_infos 의 모델 정보를 파싱한 결과를 보관한다.
+# (mtime, size) 가 바뀌면 다시 읽으며, 크기는 파일 크기로 어림한다.
+
+_model_info_cache = collections.OrderedDict()   # modelid : ((mtime, size), model_info)
+_model_info_cache_bytes = 0
+_model_info_cache_hits = 0
+_model_info_cache_misses = 0
+_model_info_cache_lock = threading.RLock()
+
+# _model_info_cache_lock 을 잡은 상태에서 호출한다.
+def drop_model_info_cache(modelid):
+    global _model_info_cache_bytes
+    
+    entry = _model_info_cache.pop(str(modelid), None)
+    if entry:
+        _model_info_cache_bytes = _model_info_cache_bytes - entry[0][1]
+
+def clear_model_info_cache():
+    global _model_info_cache_bytes
+    
+    with _model_info_cache_lock:
+        _model_info_cache.clear()
+        _model_info_cache_bytes = 0
+        
+def get_model_info_cache_stats()->dict:
+    with _model_info_cache_lock:
+        total = _model_info_cache_hits + _model_info_cache_misses
+        return {
+            "hits": _model_info_cache_hits,
+            "misses": _model_info_cache_misses,
+            "hit_rate": _model_info_cache_hits / total if total > 0 else 0.0,
+            "items": len(_model_info_cache),
+            "bytes": _model_info_cache_bytes
+        }
@@ -8,6 +8,7 @@ import shutil
 from . import util
 from . import model
 from . import civitai
+from . import refresh_scheduler
 from . import ishortcut
 from . import setting
 from . import classification
@@ -740,6 +741,7 @@ def on_file_gallery_loading(image_url):
         
 def load_saved_model(modelid=None, ver_index=None):
     if modelid:
+        refresh_scheduler.touch(modelid)
         model_info,versionid,version_name,model_url,downloaded_versions,model_type,model_basemodels,versions_list,dhtml,triger,files,title_name,images_url,images_meta,vs_foldername = get_model_information(modelid,None,ver_index)    
         if model_info:
             downloaded_info = None
@@ -1058,16 +1060,19 @@ def upload_shortcut_by_files(files, register_information_only, progress):
                     if model_id:                    
                         modelids.append(model_id)                    
         
-        for model_id in progress.tqdm(modelids, desc=f"Civitai Shortcut"): 
-            if model_id:                    
-                add_ISC = ishortcut.add(add_ISC, model_id, register_information_only, progress)
+        model_infos = civitai.get_model_infos(modelids)
+        with ishortcut.backup_batch():
+            for model_id in progress.tqdm(modelids, desc=f"Civitai Shortcut"): 
+                if model_id:                    
+                    add_ISC = ishortcut.add(add_ISC, model_id, register_information_only, progress, model_infos.get(str(model_id)))
                       
-        ISC = ishortcut.load()
-        if ISC:
-            ISC.update(add_ISC)
-        else:
-            ISC = add_ISC            
-        ishortcut.save(ISC)
+        with ishortcut.store_lock():
+            ISC = ishortcut.load()
+            if ISC:
+                ISC.update(add_ISC)
+            else:
+                ISC = add_ISC            
+            ishortcut.save(ISC)
         
     return modelids
 
@@ -1075,19 +1080,24 @@ def upload_shortcut_by_urls(urls, register_information_only, progress):
     modelids = list()
     if urls:
         add_ISC = dict()
-        for url in progress.tqdm(urls, desc=f"Civitai Shortcut"):                        
+        for url in urls:
             if url:                                  
                 model_id = util.get_model_id_from_url(url)
                 if model_id:                    
-                    add_ISC = ishortcut.add(add_ISC, model_id, register_information_only, progress)
                     modelids.append(model_id)
+                    
+        model_infos = civitai.get_model_infos(modelids)
+        with ishortcut.backup_batch():
+            for model_id in progress.tqdm(modelids, desc=f"Civitai Shortcut"):                        
+                add_ISC = ishortcut.add(add_ISC, model_id, register_information_only, progress, model_infos.get(str(model_id)))
                       
-        ISC = ishortcut.load()
-        if ISC:
-            ISC.update(add_ISC)
-        else:
-            ISC = add_ISC            
-        ishortcut.save(ISC)
+        with ishortcut.store_lock():
+            ISC = ishortcut.load()
+            if ISC:
+                ISC.update(add_ISC)
+            else:
+                ISC = add_ISC            
+            ishortcut.save(ISC)
         
     return modelids
 
@@ -0,0 +1,214 @@
+import os
+import json
+import sqlite3
+import threading
+
+from . import util
+from . import setting
+from . import journal
+
+# CivitaiShortCut.json 을 대신하는 sqlite 저장소
+# 숏컷 하나가 한 행이며 데이터는 json 문자열로 저장한다.
+# 행 단위로 갱신하므로 노트 하나를 바꿀때 전체 파일을 다시 쓰지 않는다.
+# 연결은 스레드마다 하나를 열어 두고 다시 쓰며, 테이블 생성과 마이그레이션은 프로세스에서 한번만 한다.
+
+_local = threading.local()
+_initialized = set()    # 초기화한 데이터베이스 경로
+_init_lock = threading.Lock()
+
+def initialize(conn):
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS shortcuts (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    migrate_from_json(conn, setting.shortcut)
+
+def connect():
+    path = setting.shortcut_db
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == path:
+        return conn
+
+    if conn is not None:
+        close()
+
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if path not in _initialized:
+                initialize(conn)
+                _initialized.add(path)
+    except Exception as e:
+        conn.close()
+        raise
+
+    _local.conn = conn
+    _local.path = path
+    return conn
+
+def close():
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    _local.path = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception as e:
+            pass
+
+def dumps(cis)->str:
+    return json.dumps(cis, ensure_ascii=False, sort_keys=True)
+
+def is_migrated(conn)->bool:
+    row = conn.execute("SELECT value FROM meta WHERE key='migrated'").fetchone()
+    return True if row else False
+
+# 기존의 json 파일이 있으면 한번만 가져온다.
+# 아직 스냅샷에 합쳐지지 않은 journal 의 변경 내용도 같이 가져온다.
+def migrate_from_json(conn, json_path):
+    if is_migrated(conn):
+        return
+
+    json_data = None
+    if os.path.isfile(json_path) or os.path.isfile(journal.journal_path(json_path)):
+        try:
+            json_data = journal.read(json_path)
+        except Exception as e:
+            util.printD(f"Unable to migrate the shortcut file : {json_path}")
+            return
+
+    with conn:
+        if json_data:
+            conn.executemany(
+                "INSERT OR IGNORE INTO shortcuts (id, data) VALUES (?, ?)",
+                [(str(k), dumps(v)) for k, v in json_data.items()]
+            )
+            util.printD(f"Migrated {len(json_data)} shortcuts to {setting.shortcut_db}")
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)", (json_path,))
+
+def load()->dict:
+    try:
+        conn = connect()
+    except Exception as e:
+        util.printD("Error when opening database:" + setting.shortcut_db)
+        return None
+
+    try:
+        rows = conn.execute("SELECT id, data FROM shortcuts ORDER BY rowid").fetchall()
+    except Exception as e:
+        util.printD("Error when reading database:" + setting.shortcut_db)
+        return None
+
+    if not rows:
+        return None
+
+    return {k: json.loads(data) for k, data in rows}
+
+def get(modelid):
+    if not modelid:
+        return None
+
+    try:
+        conn = connect()
+    except Exception as e:
+        return None
+
+    try:
+        row = conn.execute("SELECT data FROM shortcuts WHERE id=?", (str(modelid),)).fetchone()
+    except Exception as e:
+        return None
+
+    return json.loads(row[0]) if row else None
+
+# 바뀐 행만 쓰고 없어진 행은 지운다. 하나의 트랜잭션으로 처리한다.
+# changed 에 바뀐 숏컷 아이디를 주면 그 행만 쓰거나 지우고, 없으면 저장된 내용 전체와 비교한다.
+def save(ISC:dict, changed:list=None)->bool:
+    if not ISC:
+        ISC = dict()
+
+    try:
+        conn = connect()
+    except Exception as e:
+        util.printD("Error when opening database:" + setting.shortcut_db)
+        return False
+
+    try:
+        with conn:
+            if changed is None:
+                stored = dict(conn.execute("SELECT id, data FROM shortcuts").fetchall())
+                new_rows = {str(k): dumps(v) for k, v in ISC.items()}
+
+                upserts = [(k, data) for k, data in new_rows.items() if stored.get(k) != data]
+                deletes = [(k,) for k in stored.keys() if k not in new_rows]
+            else:
+                upserts = [(str(k), dumps(ISC[k])) for k in changed if k in ISC]
+                deletes = [(str(k),) for k in changed if k not in ISC]
+
+            if upserts:
+                conn.executemany(
+                    "INSERT INTO shortcuts (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data=excluded.data",
+                    upserts
+                )
+            if deletes:
+                conn.executemany("DELETE FROM shortcuts WHERE id=?", deletes)
+    except Exception as e:
+        util.printD("Error when writing database:" + setting.shortcut_db)
+        return False
+
+    return True
+
+def upsert(modelid, cis:dict)->bool:
+    if not modelid or cis is None:
+        return False
+
+    try:
+        conn = connect()
+    except Exception as e:
+        return False
+
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO shortcuts (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data=excluded.data",
+                (str(modelid), dumps(cis))
+            )
+    except Exception as e:
+        util.printD("Error when writing database:" + setting.shortcut_db)
+        return False
+
+    return True
+
+def remove(modelid)->bool:
+    if not modelid:
+        return False
+
+    try:
+        conn = connect()
+    except Exception as e:
+        return False
+
+    try:
+        with conn:
+            conn.execute("DELETE FROM shortcuts WHERE id=?", (str(modelid),))
+    except Exception as e:
+        util.printD("Error when writing database:" + setting.shortcut_db)
+        return False
+
+    return True
+
+# 데이터베이스의 내용을 기존 형식의 json 파일로 내보낸다.
+def export_json(path)->bool:
+    ISC = load()
+    if not ISC:
+        ISC = dict()
+
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(ISC, f, indent=4)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        util.printD("Error when writing file:" + path)
+        return False
+
+    return True
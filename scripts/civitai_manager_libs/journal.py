@@ -0,0 +1,181 @@
+import os
+import json
+import threading
+
+from . import util
+from . import setting
+from . import storelock
+
+# json 저장소(숏컷, 분류, 레시피)의 변경 내역을 저장소 옆의 <파일>.journal 에 한줄씩 추가한다.
+# 한줄이 하나의 변경이며 최상위 키 단위로 기록한다.
+#   {"op": "set", "key": "1234", "value": {...}}
+#   {"op": "del", "key": "1234"}
+# 읽을때는 마지막 스냅샷(원래의 json 파일) 위에 journal 을 순서대로 적용한다.
+# journal 이 setting.journal_compact_size 보다 커지면 백그라운드에서 스냅샷으로 합친다.
+
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+def journal_path(path):
+    return f"{path}.journal"
+
+def stat(path):
+    result = list()
+    for p in (path, journal_path(path)):
+        try:
+            st = os.stat(p)
+            result.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            result.append(None)
+    return tuple(result)
+
+def diff(old:dict, new:dict)->list:
+    if not old:
+        old = dict()
+    if not new:
+        new = dict()
+
+    records = list()
+    for k, v in new.items():
+        if k not in old or old[k] != v:
+            records.append({"op": "set", "key": k, "value": v})
+
+    for k in old.keys():
+        if k not in new:
+            records.append({"op": "del", "key": k})
+
+    return records
+
+def replay(path, data:dict)->dict:
+    if not os.path.isfile(journal_path(path)):
+        return data
+
+    if data is None:
+        data = dict()
+
+    with open(journal_path(path), 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except:
+                # 기록 중에 중단된 마지막 줄은 무시한다.
+                continue
+
+            if record.get("op") == "set":
+                data[record["key"]] = record["value"]
+            elif record.get("op") == "del":
+                data.pop(record["key"], None)
+
+    return data
+
+def read(path)->dict:
+    with storelock.lock(path):
+        json_data = None
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                json_data = json.load(f)
+
+        return replay(path, json_data)
+
+def write_snapshot(path, data:dict)->bool:
+    with storelock.lock(path):
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, path)
+
+            if os.path.isfile(journal_path(path)):
+                os.remove(journal_path(path))
+        except Exception as e:
+            util.printD("Error when writing file:" + path)
+            return False
+
+    return True
+
+# 기록 중에 중단되면 마지막 줄이 줄바꿈 없이 끝난다.
+def ends_with_newline(path)->bool:
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except OSError:
+        return True
+
+def append(path, records:list)->bool:
+    if not records:
+        return True
+
+    with storelock.lock(path):
+        try:
+            # 중단된 마지막 줄에 이어 쓰면 새 기록까지 읽지 못하므로 줄을 바꾸고 쓴다.
+            torn = not ends_with_newline(journal_path(path))
+            with open(journal_path(path), 'a') as f:
+                if torn:
+                    f.write("\n")
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                f.flush()
+        except Exception as e:
+            util.printD("Error when writing file:" + journal_path(path))
+            return False
+
+    return True
+
+# old 는 현재 저장되어 있는 내용이다. 없으면 전체를 스냅샷으로 쓴다.
+def write(path, data:dict, old:dict=None)->bool:
+    if data is None:
+        data = dict()
+
+    if not setting.journal_enable or old is None or not os.path.isfile(path):
+        return write_snapshot(path, data)
+
+    if not append(path, diff(old, data)):
+        return False
+
+    compact_async(path)
+    return True
+
+def compact(path)->bool:
+    with storelock.lock(path):
+        if not os.path.isfile(journal_path(path)):
+            return True
+        try:
+            data = read(path)
+        except Exception as e:
+            util.printD("Error when compacting file:" + path)
+            return False
+        return write_snapshot(path, data)
+
+def compact_async(path, force=False):
+    if not force:
+        try:
+            if os.path.getsize(journal_path(path)) < setting.journal_compact_size:
+                return
+        except OSError:
+            return
+
+    with _compacting_lock:
+        if path in _compacting:
+            return
+        _compacting.add(path)
+
+    def run():
+        try:
+            compact(path)
+        finally:
+            with _compacting_lock:
+                _compacting.discard(path)
+
+    try:
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+    except Exception as e:
+        util.printD(e)
+        with _compacting_lock:
+            _compacting.discard(path)
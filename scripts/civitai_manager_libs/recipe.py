@@ -1,60 +1,51 @@
 import os
+import copy
 import json
+import threading
+import types
 
 from . import util
 from . import setting
+from . import journal
+from . import storelock
 
 def get_list(search=None, classification=None, shortcuts=None):    
 
-    RecipeCollection = load()                           
-    if not RecipeCollection:
+    index = get_index()
+    if not index:
         return
                 
-    result_list = dict()
-    
     keys, descs, notes = util.get_search_keyword(search)
 
     # filtering classification
-    for name, v in RecipeCollection.items():
-        if classification:
-            if v['classification'] and classification == v['classification']:
-                result_list[name] = v
-        else:
-            result_list[name] = v
+    if classification:
+        result_list = index["classifications"].get(classification, dict())
+    else:
+        result_list = index["names"]
 
     # filtering shortcuts
     if shortcuts:
-        shortcut_list = dict()
-        for name, v in result_list.items():
-            if 'shortcuts' in v.keys():
-                different_shortcuts = set(shortcuts) - set(v["shortcuts"])
-                if not different_shortcuts:
-                    shortcut_list[name]= v
-                                        
-        result_list = shortcut_list    
+        shortcut_list = None
+        for shortcut in shortcuts:
+            names = index["shortcuts"].get(shortcut, set())
+            shortcut_list = set(names) if shortcut_list is None else shortcut_list & names
+            if not shortcut_list:
+                break
+        result_list = {name: None for name in result_list if name in shortcut_list}
     
     # filtering key
     if keys:
-        key_list = dict()
-        for name, v in result_list.items():
-            for key in keys:
-                if key in name.lower():
-                    key_list[name] = v
-                    break                    
-        result_list = key_list
+        key_list = set()
+        for key in keys:
+            key_list |= search_index(index["name_grams"], index["names"], key)
+        result_list = {name: None for name in result_list if name in key_list}
     
     # filtering descs
     if descs:
-        desc_list = dict()
-        for name, v in result_list.items():            
-            if not v['description']:
-                continue
-
-            for desc in descs:                    
-                if desc in v['description'].lower():
-                    desc_list[name] = v
-                    break                    
-        result_list = desc_list        
+        desc_list = set()
+        for desc in descs:
+            desc_list |= search_index(index["desc_grams"], index["descs"], desc)
+        result_list = {name: None for name in result_list if name in desc_list}
     
     # 필요한것으로 변환
     recipelist = list()
@@ -64,45 +55,35 @@ def get_list(search=None, classification=None, shortcuts=None):
     return recipelist  
 
 def get_reference_shortcuts():    
-    RecipeCollection = load()
+    index = get_index()
     reference_shortcuts = list()
     
-    if not RecipeCollection:        
+    if not index:        
         return reference_shortcuts
     
-    for v in RecipeCollection.values():
-        if 'shortcuts' in v.keys():
-            reference_shortcuts.extend(v['shortcuts'])
-                
-    reference_shortcuts = list(set(reference_shortcuts))
+    reference_shortcuts = list(index["shortcuts"].keys())
         
     return reference_shortcuts
 
 def get_classifications():    
-    RecipeCollection = load()
+    index = get_index()
     classifications = list()
     
-    if not RecipeCollection:        
+    if not index:        
         return classifications
     
-    for v in RecipeCollection.values():
-        if v['classification']:
-            classifications.append(v['classification'])
-                
-    classifications = list(set(classifications))
+    classifications = [k for k in index["classifications"].keys() if k]
         
     return classifications
 
 def is_classifications(classification):    
-    RecipeCollection = load()
+    index = get_index()
 
-    if not RecipeCollection:        
+    if not index:        
         return False
     
     try:
-        for v in RecipeCollection.values():
-            if v['classification'] == classification:
-                return True
+        return classification in index["classifications"]
     except:
         pass
                 
@@ -120,79 +101,84 @@ def get_recipe_shortcuts(recipe):
     return None
 
 def update_recipe_shortcuts(recipe, shortcuts:list):
-    if not recipe:
-        return
+    with store_lock():
+        if not recipe:
+            return
     
-    RecipeCollection = load()
-    RecipeCollection = update_shortcuts(RecipeCollection, recipe, shortcuts)    
-    save(RecipeCollection)
+        RecipeCollection = load()
+        RecipeCollection = update_shortcuts(RecipeCollection, recipe, shortcuts)    
+        save(RecipeCollection)
 
-    if RecipeCollection:
-        if recipe in RecipeCollection:
-            return True
+        if RecipeCollection:
+            if recipe in RecipeCollection:
+                return True
         
-    return False
+        return False
 
 def update_recipe_image(recipe, image):
-    if not recipe:
-        return
+    with store_lock():
+        if not recipe:
+            return
     
-    RecipeCollection = load()
-    RecipeCollection = update_image(RecipeCollection, recipe, image)    
-    save(RecipeCollection)
+        RecipeCollection = load()
+        RecipeCollection = update_image(RecipeCollection, recipe, image)    
+        save(RecipeCollection)
 
-    if RecipeCollection:
-        if recipe in RecipeCollection:
-            return True
+        if RecipeCollection:
+            if recipe in RecipeCollection:
+                return True
         
-    return False  
+        return False  
 
 def delete_recipe(s_name):
-    if not s_name:
-        return
+    with store_lock():
+        if not s_name:
+            return
         
-    RecipeCollection = load()
-    RecipeCollection = delete(RecipeCollection,s_name)
-    save(RecipeCollection)
+        RecipeCollection = load()
+        RecipeCollection = delete(RecipeCollection,s_name)
+        save(RecipeCollection)
         
 def update_recipe(recipe, name, desc, prompt=None, classification=None):
-    if not recipe:
-        return
+    with store_lock():
+        if not recipe:
+            return
 
-    if not name:
-        return
+        if not name:
+            return
 
-    name = name.strip()
+        name = name.strip()
     
-    RecipeCollection = load()
-    RecipeCollection = update(RecipeCollection, recipe, name, desc, prompt, classification)
+        RecipeCollection = load()
+        RecipeCollection = update(RecipeCollection, recipe, name, desc, prompt, classification)
     
-    save(RecipeCollection)
+        save(RecipeCollection)
 
-    if RecipeCollection:
-        if name in RecipeCollection:
-            return True
+        if RecipeCollection:
+            if name in RecipeCollection:
+                return True
         
-    return False    
+        return False    
 
 def create_recipe(recipe, desc, prompt=None, classification=None):    
-    if recipe and len(recipe.strip()) > 0:
-        recipe = recipe.strip()
-        RecipeCollection = load()                
-        if not RecipeCollection:
-            RecipeCollection = dict()
-        else:
-            if recipe in RecipeCollection:
-                return False
+    with store_lock():
+        if recipe and len(recipe.strip()) > 0:
+            recipe = recipe.strip()
+            RecipeCollection = load()                
+            if not RecipeCollection:
+                RecipeCollection = dict()
+            else:
+                if recipe in RecipeCollection:
+                    return False
                         
-        RecipeCollection = create(RecipeCollection, recipe, desc, prompt, classification)
+            RecipeCollection = create(RecipeCollection, recipe, desc, prompt, classification)
         
-        save(RecipeCollection)
+            save(RecipeCollection)
             
-        if RecipeCollection:
-            if recipe in RecipeCollection:
-                return True
-    return False
+            if RecipeCollection:
+                if recipe in RecipeCollection:
+                    return True
+        return False
 
 def get_recipe(s_name):
     if not s_name:
@@ -363,32 +349,45 @@ def update(RecipeCollection:dict, recipe, name, desc, prompt=None, classificatio
     return RecipeCollection
 
 def save(RecipeCollection:dict):
-    output = ""
+    with store_lock():
+        output = ""
     
-    #write to file    
-    try:
-        with open(setting.shortcut_recipe, 'w') as f:
-            json.dump(RecipeCollection, f, indent=4)
-    except Exception as e:
-        util.printD("Error when writing file:"+setting.shortcut_recipe)
-        return output
+        # 저장되어 있는 내용과 비교하여 바뀐 부분만 journal 에 기록한다.
+        old_RecipeCollection = get_cache() if os.path.isfile(setting.shortcut_recipe) else None
+    
+        #write to file    
+        if not journal.write(setting.shortcut_recipe, RecipeCollection, old_RecipeCollection):
+            invalidate_cache()
+            return output
 
-    output = "Recipe saved to: " + setting.shortcut_recipe
-    #util.printD(output)
+        set_cache(RecipeCollection)
+    
+        output = "Recipe saved to: " + setting.shortcut_recipe
+        #util.printD(output)
 
-    return output
+        return output
 
 def load()->dict:
-    if not os.path.isfile(setting.shortcut_recipe):
+    RecipeCollection = get_cache()
+    if not RecipeCollection:
+        return None
+    
+    return copy.deepcopy(RecipeCollection)
+
+# 읽기 전용 뷰를 돌려준다. 복사하지 않으므로 수정하지 않는다.
+def load_view():
+    RecipeCollection = get_cache()
+    if not RecipeCollection:
+        return None
+    
+    return types.MappingProxyType(RecipeCollection)
+
+def read_file()->dict:
+    if not os.path.isfile(setting.shortcut_recipe) and not os.path.isfile(journal.journal_path(setting.shortcut_recipe)):
         save({})
         return
     
-    json_data = None
-    try:
-        with open(setting.shortcut_recipe, 'r') as f:
-            json_data = json.load(f)
-    except:
-        return None            
+    json_data = journal.read(setting.shortcut_recipe)
 
     # check error
     if not json_data:
@@ -396,4 +395,127 @@ def load()->dict:
 
     # check for new key
     return json_data
+
+#================= cache =================================
+# 파일이 바뀌거나 save 를 통해 쓸때만 다시 읽는다.
+
+_RecipeCollection_cache = None
+_RecipeCollection_stat = None
+_RecipeCollection_index = None
+_RecipeCollection_lock = threading.RLock()
+
+def set_cache(RecipeCollection:dict):
+    global _RecipeCollection_cache, _RecipeCollection_stat, _RecipeCollection_index
+    
+    with _RecipeCollection_lock:
+        _RecipeCollection_cache = copy.deepcopy(RecipeCollection) if RecipeCollection else None
+        _RecipeCollection_stat = journal.stat(setting.shortcut_recipe)
+        _RecipeCollection_index = make_index(_RecipeCollection_cache)
+
+def invalidate_cache():
+    global _RecipeCollection_stat
+    
+    with _RecipeCollection_lock:
+        _RecipeCollection_stat = None
+    
+def get_cache()->dict:
+    with _RecipeCollection_lock:
+        if _RecipeCollection_stat is not None and _RecipeCollection_stat == journal.stat(setting.shortcut_recipe):
+            return _RecipeCollection_cache
+    
+    # 파일 잠금을 먼저 잡고 캐시 잠금을 잡는다.
+    with store_lock():
+        with _RecipeCollection_lock:
+            if _RecipeCollection_stat is not None and _RecipeCollection_stat == journal.stat(setting.shortcut_recipe):
+                return _RecipeCollection_cache
+            
+            try:
+                RecipeCollection = read_file()
+            except Exception as e:
+                # 읽지 못했다면 마지막으로 읽은 내용을 그대로 사용한다.
+                util.printD("Error when reading file:" + setting.shortcut_recipe)
+                return _RecipeCollection_cache
+            
+            set_cache(RecipeCollection)
+            return _RecipeCollection_cache
+
+def store_lock():
+    return storelock.lock(setting.shortcut_recipe)
+
+def get_index()->dict:
+    # get_cache 는 파일 잠금을 잡을수 있으므로 캐시 잠금 밖에서 부른다.
+    get_cache()
+    with _RecipeCollection_lock:
+        return _RecipeCollection_index
+
+#================= index =================================
+# 레시피 검색용 색인
+#   names : 레시피 이름(순서 유지) -> 소문자 이름
+#   descs : 레시피 이름 -> 소문자 설명
+#   classifications : 분류 -> 레시피 이름(순서 유지)
+#   shortcuts : 숏컷 -> 레시피 이름 집합
+#   name_grams, desc_grams : 3글자 조각 -> 레시피 이름 집합
+# 부분 문자열 검색은 3글자 조각으로 후보를 줄인 뒤 실제 문자열로 확인한다.
+
+def make_grams(text:str)->set:
+    if not text:
+        return set()
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+def make_index(RecipeCollection:dict)->dict:
+    if not RecipeCollection:
+        return None
+    
+    index = {
+        "names" : dict(),
+        "descs" : dict(),
+        "classifications" : dict(),
+        "shortcuts" : dict(),
+        "name_grams" : dict(),
+        "desc_grams" : dict()
+    }
+    
+    for name, v in RecipeCollection.items():
+        index["names"][name] = name.lower()
+        
+        desc = v['description'].lower() if v.get('description') else ""
+        index["descs"][name] = desc
+        
+        rc_classification = v.get('classification')
+        if rc_classification not in index["classifications"]:
+            index["classifications"][rc_classification] = dict()
+        index["classifications"][rc_classification][name] = None
+        
+        if v.get('shortcuts'):
+            for shortcut in v['shortcuts']:
+                if shortcut not in index["shortcuts"]:
+                    index["shortcuts"][shortcut] = set()
+                index["shortcuts"][shortcut].add(name)
+        
+        for gram in make_grams(index["names"][name]):
+            index["name_grams"].setdefault(gram, set()).add(name)
+            
+        for gram in make_grams(desc):
+            index["desc_grams"].setdefault(gram, set()).add(name)
+            
+    return index
+
+def search_index(grams:dict, texts:dict, word:str)->set:
+    if not word:
+        return set()
+    
+    word_grams = make_grams(word)
+    if word_grams:
+        candidates = None
+        for gram in sorted(word_grams, key=lambda g: len(grams.get(g, ()))):
+            names = grams.get(gram)
+            if not names:
+                return set()
+            candidates = set(names) if candidates is None else candidates & names
+            if not candidates:
+                return set()
+    else:
+        candidates = texts.keys()
+        
+    return {name for name in candidates if word in texts[name]}
 #=========================================================================
\ No newline at end of file
@@ -629,7 +629,7 @@ def on_recipe_delete_btn_click(select_name):
            
 # reference shortcuts
 def on_reference_gallery_loading(shortcuts):
-    ISC = ishortcut.load()
+    ISC = ishortcut.load_view()
     if not ISC:
         return None
         
@@ -216,7 +216,7 @@ def get_recipe_reference_list(page = 0):
 
     if shortlist:
         result = list()
-        ISC = ishortcut.load()  
+        ISC = ishortcut.load_view()  
         for shortcut in shortlist:
             # v = ishortcut.get_shortcut_model(str(shortcut))
             v = get_shortcut_by_modelid(ISC,str(shortcut))
@@ -287,7 +287,7 @@ def get_recipe_list(search=None, classification=None, shortcut=None, page = 0):
     
     if shortlist:
         result = list()
-        RecipeCollection = recipe.load()
+        RecipeCollection = recipe.load_view()
         for shortcut in shortlist:            
             # re = recipe.get_recipe(shortcut)
             re = get_recipe(RecipeCollection, shortcut)
@@ -346,7 +346,7 @@ def on_recipe_reference_select_gallery_select(evt: gr.SelectData, shortcuts):
     return shortcuts, None, gr.update(visible=False)
 
 def on_recipe_reference_select_gallery_loading(shortcuts):
-    ISC = ishortcut.load()
+    ISC = ishortcut.load_view()
     if not ISC:
         return None, gr.update(visible=False)
 
@@ -0,0 +1,126 @@
+import time
+import datetime
+import threading
+
+from . import util
+from . import model
+from . import setting
+from . import ishortcut
+
+# 시작할때 모든 숏컷을 한꺼번에 갱신하지 않고, 세션 동안 백그라운드에서 조금씩 갱신한다.
+# last_refreshed 가 setting.shortcut_refresh_ttl 초보다 오래된 숏컷만 대상이며
+# setting.shortcut_refresh_interval 초마다 setting.shortcut_refresh_batch 개씩 갱신한다.
+# 우선순위 : 새 버전이 확인된 모델 > 최근에 본 모델 > 다운받은 모델 > 나머지(오래된 순)
+# 새 버전이 확인된 모델은 TTL 과 상관없이 갱신한다.
+
+_viewed = dict()        # modelid : 본 시간
+_new_version = set()    # 새 버전이 확인된 modelid
+_attempted = dict()     # modelid : 갱신을 시도한 시간, 실패하는 모델이 계속 앞에 오지 않게 한다.
+_lock = threading.Lock()
+
+_thread = None
+_stop = threading.Event()
+
+def touch(modelid):
+    if not modelid:
+        return
+    with _lock:
+        _viewed[str(modelid)] = time.time()
+
+def mark_new_version(modelid):
+    if not modelid:
+        return
+    with _lock:
+        _new_version.add(str(modelid))
+
+def get_last_refreshed(cis)->float:
+    if not cis or not cis.get("last_refreshed"):
+        return 0
+    try:
+        return datetime.datetime.strptime(cis["last_refreshed"], "%Y-%m-%d %H:%M:%S").timestamp()
+    except Exception as e:
+        return 0
+
+# 갱신할 숏컷을 우선순위대로 돌려준다.
+def get_stale_list()->list:
+    ISC = ishortcut.load_view()
+    if not ISC:
+        return list()
+
+    now = time.time()
+    with _lock:
+        viewed = dict(_viewed)
+        new_version = set(_new_version)
+        attempted = dict(_attempted)
+
+    downloaded = model.Downloaded_Models if model.Downloaded_Models else dict()
+
+    stale = list()
+    for modelid, cis in ISC.items():
+        last_refreshed = max(get_last_refreshed(cis), attempted.get(modelid, 0))
+        is_new_version = modelid in new_version and modelid not in attempted
+        if not is_new_version and now - last_refreshed < setting.shortcut_refresh_ttl:
+            continue
+
+        stale.append((
+            not is_new_version,
+            -viewed.get(modelid, 0),
+            modelid not in downloaded,
+            last_refreshed,
+            modelid
+        ))
+
+    return [item[-1] for item in sorted(stale)]
+
+def refresh_next()->int:
+    if setting.offline_mode:
+        return 0
+
+    batch = get_stale_list()[:max(1, setting.shortcut_refresh_batch)]
+    if not batch:
+        return 0
+
+    now = time.time()
+    with _lock:
+        for modelid in batch:
+            _attempted[modelid] = now
+            _new_version.discard(modelid)
+
+    return ishortcut.refresh_model_informations(batch)
+
+def run():
+    while not _stop.is_set():
+        try:
+            refresh_next()
+        except Exception as e:
+            util.printD(e)
+
+        _stop.wait(max(1, setting.shortcut_refresh_interval))
+
+def start():
+    global _thread
+
+    if _thread and _thread.is_alive():
+        return
+
+    _stop.clear()
+    try:
+        _thread = threading.Thread(target=run, daemon=True)
+        _thread.start()
+    except Exception as e:
+        util.printD(e)
+
+def stop():
+    _stop.set()
+
+def get_status()->dict:
+    with _lock:
+        viewed = len(_viewed)
+        new_version = len(_new_version)
+
+    return {
+        "running": bool(_thread and _thread.is_alive()),
+        "stale": len(get_stale_list()),
+        "viewed": viewed,
+        "new_version": new_version
+    }
@@ -0,0 +1,136 @@
+import os
+import copy
+import time
+
+from . import util
+from . import model
+from . import setting
+from . import civitai
+from . import ishortcut
+
+# 모델/버전 정보를 로컬에서 먼저 찾고, 없거나 오래되었을때만 civitai 에 요청한다.
+#   - 모델 정보 : sc_infos/<modelid>/<modelid>.civitai.info
+#   - 버전 정보 : 다운받은 모델의 .civitai.info, 없으면 sc_infos 의 모델 정보에서 만든다.
+# 파일이 setting.local_info_ttl 초보다 오래되지 않았으면 그대로 쓴다.
+# setting.offline_mode 이면 요청하지 않고 오래된 정보라도 로컬에 있는 것만 쓴다.
+# 요청에 실패하면 오래된 로컬 정보를 돌려준다.
+
+def is_offline()->bool:
+    return setting.offline_mode
+
+def is_fresh(path)->bool:
+    if setting.offline_mode:
+        return True
+
+    if setting.local_info_ttl <= 0:
+        return False
+
+    try:
+        return (time.time() - os.path.getmtime(path)) < setting.local_info_ttl
+    except OSError:
+        return False
+
+def get_model_info_path(modelid)->str:
+    return os.path.join(setting.shortcut_info_folder, str(modelid), f"{modelid}{setting.info_suffix}{setting.info_ext}")
+
+def get_model_info(modelid:str) -> dict:
+    if not modelid:
+        return None
+
+    modelid = str(modelid)
+    local_info = ishortcut.get_model_info(modelid)
+    if local_info and is_fresh(get_model_info_path(modelid)):
+        return local_info
+
+    if setting.offline_mode:
+        return None
+
+    model_info = civitai.get_model_info(modelid)
+    if not model_info:
+        return local_info if local_info else model_info
+
+    if local_info:
+        # 숏컷으로 등록된 모델이면 새 정보로 sc_infos 와 요약 정보를 갱신한다.(이미지는 받지 않는다)
+        ishortcut.write_model_information(modelid, True, None, model_info)
+        ishortcut.update_model_summaries({modelid: ishortcut.make_model_summary(model_info)}, True)
+
+    return model_info
+
+# 모델 정보의 버전에는 modelId, model 이 없으므로 api 의 버전 정보와 같은 모양으로 채워준다.
+# 모델 정보는 ishortcut 의 캐시와 공유되므로 호출자가 수정해도 되도록 복사해서 만든다.
+def make_version_info(model_info:dict, version:dict) -> dict:
+    if not model_info or not version:
+        return None
+
+    version_info = copy.deepcopy(version)
+    version_info["modelId"] = model_info["id"]
+    version_info["model"] = {
+        "name": model_info.get("name"),
+        "type": model_info.get("type"),
+        "nsfw": model_info.get("nsfw"),
+        "poi": model_info.get("poi"),
+    }
+    return version_info
+
+def find_version(model_info:dict, version_id) -> dict:
+    if not model_info or "modelVersions" not in model_info.keys():
+        return None
+
+    for version in model_info["modelVersions"]:
+        if str(version.get("id")) == str(version_id):
+            return version
+    return None
+
+def find_modelid_by_version_id(version_id):
+    ISC = ishortcut.load_view()
+    if not ISC:
+        return None
+
+    for modelid, cis in ISC.items():
+        summary = cis.get("summary") if cis else None
+        if summary and str(version_id) in summary.get("versions", []):
+            return modelid
+    return None
+
+def get_local_version_info(version_id:str):
+    # 다운받은 모델의 버전 정보 파일
+    infopaths = model.get_infopaths(version_id)
+    if infopaths:
+        for path in infopaths.keys():
+            version_info = util.read_json(path)
+            if version_info and str(version_info.get("id")) == str(version_id):
+                return version_info, path
+
+    # 숏컷의 모델 정보
+    modelid = find_modelid_by_version_id(version_id)
+    if modelid:
+        model_info = ishortcut.get_model_info(modelid)
+        version_info = make_version_info(model_info, find_version(model_info, version_id))
+        if version_info:
+            return version_info, get_model_info_path(modelid)
+
+    return None, None
+
+def get_version_info(version_id:str) -> dict:
+    if not version_id:
+        return None
+
+    local_info, path = get_local_version_info(version_id)
+    if local_info and is_fresh(path):
+        return local_info
+
+    if setting.offline_mode:
+        return None
+
+    version_info = civitai.get_version_info_by_version_id(str(version_id))
+    if not version_info:
+        return local_info if local_info else version_info
+
+    return version_info
+
+def get_latest_version_info(modelid:str) -> dict:
+    model_info = get_model_info(modelid)
+    if not model_info or "modelVersions" not in model_info.keys() or len(model_info["modelVersions"]) == 0:
+        return model_info if civitai.is_throttled(model_info) else None
+
+    return make_version_info(model_info, model_info["modelVersions"][0])
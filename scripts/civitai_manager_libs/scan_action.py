@@ -1,14 +1,19 @@
 import os
 import gradio as gr
 import datetime
-import requests
 import shutil
 import json
+import queue
+import threading
+import time
 
 from . import util
 from . import model
 from . import setting
+from . import httpclient
 from . import civitai
+from . import resolver
+from . import hashcache
 
 from . import ishortcut
 from . import ishortcut_action
@@ -114,17 +119,21 @@ def on_scan_ui():
         outputs=[update_lora_meta_progress]
     )
                 
+# (civitai 에 없는 파일, 요청이 제한되어 확인하지 못한 파일) 을 돌려준다.
 def create_models_information(files, mfolder, vs_folder, register_shortcut, progress=gr.Progress()):
     
     non_list = list()    
+    throttled_list = list()
     if not files:
-        return None
+        return None, None
     
-    for file_path in progress.tqdm(files, desc=f"Create Models Information"): 
-        if os.path.isfile(file_path):                        
-            util.printD(f"Generate SHA256: {file_path}")
-            hash = util.calculate_sha256(file_path)
-            version_info = civitai.get_version_info_by_hash(hash)
+    files = [file_path for file_path in files if os.path.isfile(file_path)]
+    for file_path, version_info in progress.tqdm(lookup_files_by_hash(files), total=len(files), desc=f"Create Models Information"): 
+        if file_path:
+            if civitai.is_throttled(version_info):
+                # 등록되지 않은 모델이 아니라 나중에 다시 확인해야 하는 모델이다.
+                throttled_list.append(file_path)
+                continue
             
             if not version_info:
                 # These models are not registered with Civitai.
@@ -165,7 +174,7 @@ def create_models_information(files, mfolder, vs_folder, register_shortcut, prog
                             if img_dict["width"]:
                                 img_url =  util.change_width_from_image_url(img_url, img_dict["width"])
                         # get image
-                        with requests.get(img_url, stream=True, verify=False, proxies=setting.proxies) as img_r:
+                        with httpclient.get(img_url, stream=True) as img_r:
                             if not img_r.ok:
                                 util.printD("Get error code: " + str(img_r.status_code))
                                 return
@@ -192,7 +201,106 @@ def create_models_information(files, mfolder, vs_folder, register_shortcut, prog
                     ishortcut.update_shortcut(version_info['modelId'], progress)                    
                     model.update_downloaded_model()
                 
-    return non_list
+    if throttled_list:
+        util.printD(f"{len(throttled_list)} models were rate limited by Civitai. Please try again later.")
+        
+    return non_list, throttled_list
+
+# 해시 계산과 버전 정보 요청을 나누어 동시에 진행한다.
+# 해시 스레드가 계산한 해시를 모아서 civitai.get_version_infos_by_hash 로 한번에 요청하고
+# 끝나는 순서대로 (파일, 버전 정보) 를 돌려준다.
+# 요청이 제한된 해시는 다시 요청하고, 그래도 제한되면 버전 정보 대신 civitai.Throttled 를 돌려준다.
+def lookup_files_by_hash(files:list):
+    if not files:
+        return
+    
+    hash_queue = queue.Queue(maxsize=setting.hash_lookup_chunk_size * 2)
+    result_queue = queue.Queue()
+    throttled = list()
+    
+    # 요청이 제한된 (파일, 해시) 는 돌려주지 않고 따로 모은다.
+    def lookup_batch(batch):
+        retry = list()
+        version_infos = civitai.get_version_infos_by_hash([hash for file_path, hash in batch if hash])
+        for file_path, hash in batch:
+            version_info = version_infos.get(hash.lower()) if hash else None
+            if civitai.is_throttled(version_info):
+                retry.append((file_path, hash))
+            else:
+                result_queue.put((file_path, version_info))
+        return retry
+    
+    def hashing():
+        try:
+            with hashcache.batch():
+                for file_path in files:
+                    hash = None
+                    try:
+                        util.printD(f"Generate SHA256: {file_path}")
+                        hash = hashcache.get_sha256(file_path)
+                    except Exception as e:
+                        util.printD(f"Unable to generate SHA256: {file_path}")
+                    hash_queue.put((file_path, hash))
+        finally:
+            hash_queue.put(None)
+    
+    def lookup():
+        nonlocal throttled
+        try:
+            done = False
+            while not done:
+                batch = list()
+                item = hash_queue.get()
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= setting.hash_lookup_chunk_size:
+                        break
+                    try:
+                        # 잠깐 기다려서 계산이 끝난 해시를 더 모은다.
+                        item = hash_queue.get(timeout=0.5)
+                    except queue.Empty:
+                        break
+                
+                if item is None:
+                    done = True
+                
+                if batch:
+                    throttled.extend(lookup_batch(batch))
+            
+            # 요청이 제한된 해시는 잠시 기다렸다가 다시 요청한다.
+            for attempt in range(setting.http_max_retries):
+                if not throttled:
+                    break
+                time.sleep(min(max(setting.http_backoff_factor * (2 ** (attempt + 1)), 1.0), 300.0))
+                batch = throttled
+                throttled = list()
+                for i in range(0, len(batch), max(1, setting.hash_lookup_chunk_size)):
+                    throttled.extend(lookup_batch(batch[i:i + max(1, setting.hash_lookup_chunk_size)]))
+            
+            # 끝까지 제한된 파일은 Throttled 로 돌려준다.
+            for file_path, hash in throttled:
+                result_queue.put((file_path, httpclient.Throttled(civitai.Url_Hash(), None)))
+        except Exception as e:
+            util.printD(e)
+        finally:
+            result_queue.put(None)
+    
+    threads = [threading.Thread(target=hashing, daemon=True), threading.Thread(target=lookup, daemon=True)]
+    for thread in threads:
+        thread.start()
+        
+    done_files = set()
+    while True:
+        item = result_queue.get()
+        if item is None:
+            break
+        done_files.add(item[0])
+        yield item
+    
+    # 요청 단계가 중간에 실패하면 남은 파일은 등록되지 않은 모델로 돌려준다.
+    for file_path in files:
+        if file_path not in done_files:
+            yield file_path, None
 
 def is_filename_in_version_info_in_directory(directory, filename):
    
@@ -272,9 +380,16 @@ def scan_models(fix_information_filename, progress=gr.Progress()):
 #             pass
     
 def on_create_models_info_btn_click(files, mfolder, vsfolder, register_shortcut, progress=gr.Progress()):
-    remain_files = create_models_information(files,mfolder,vsfolder,register_shortcut, progress)
-    if remain_files and len(remain_files) > 0:
-        return gr.update(choices=remain_files, value=remain_files, interactive=True, label="These models are not registered with Civitai."),gr.update(visible=True),gr.update(visible=True)    
+    non_list, throttled_list = create_models_information(files,mfolder,vsfolder,register_shortcut, progress)
+    if throttled_list:
+        # 제한된 파일도 목록에 남겨서 다시 실행할수 있게 한다.
+        remain_files = (non_list if non_list else []) + throttled_list
+        label = f"{len(throttled_list)} models were rate limited by Civitai, retry later."
+        if non_list:
+            label = f"{len(non_list)} models are not registered with Civitai. {label}"
+        return gr.update(choices=remain_files, value=remain_files, interactive=True, label=label),gr.update(visible=True),gr.update(visible=True)
+    if non_list and len(non_list) > 0:
+        return gr.update(choices=non_list, value=non_list, interactive=True, label="These models are not registered with Civitai."),gr.update(visible=True),gr.update(visible=True)    
     return gr.update(choices=[], value=[], interactive=True),gr.update(visible=False),gr.update(visible=False)  
          
 def on_scan_models_btn_click(fix_information_filename, progress=gr.Progress()):
@@ -309,4 +424,4 @@ def update_lora_meta(progress=gr.Progress()):
         metafile = os.path.join(vfolder, f"{basename}.json")
 
         if not os.path.isfile(metafile):
-            civitai.write_LoRa_metadata_by_version_id(metafile, str(version_id))
+            civitai.write_LoRa_metadata(metafile, resolver.get_version_info(str(version_id)))
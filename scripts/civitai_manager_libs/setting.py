@@ -140,6 +140,18 @@ gallery_thumbnail_image_style = "scale-down"
 # 다운로드 설정
 download_images_folder = os.path.join("outputs","download-images")
 
+# 다운로드 설정 : 이 크기(byte)보다 큰 파일은 여러 구간으로 나누어 동시에 받는다. 1 이하면 나누지 않는다.
+download_segments = 4
+download_segment_threshold = 64 * 1024 * 1024
+# 동시에 받는 모델 파일 수
+download_workers = 2
+# 받을때 쓰는 버퍼 크기(byte), 버퍼는 스레드마다 하나를 만들어 다시 쓴다.
+download_buffer_size = 4 * 1024 * 1024
+# 받기 전에 파일 크기만큼 디스크 공간을 잡아둔다.(posix_fallocate 를 쓸수 있을때)
+download_preallocate = True
+# 받으면서 계산할 해시, civitai 의 파일 해시와 비교한다. SHA256, CRC32, BLAKE3(blake3 패키지가 있을때)
+download_hashes = ["SHA256"]
+
 # background thread 설정
 # shortcut_auto_update = True
 shortcut_update_when_start = True
@@ -151,12 +163,71 @@ shortcut_setting = "CivitaiShortCutSetting.json"
 shortcut_classification = "CivitaiShortCutClassification.json"
 shortcut_civitai_internet_shortcut_url = "CivitaiShortCutBackupUrl.json"
 shortcut_recipe = "CivitaiShortCutRecipeCollection.json"
+shortcut_db = "CivitaiShortCut.db"
+shortcut_download_queue = "CivitaiShortCutDownloadQueue.json"
+shortcut_hash_cache = "CivitaiShortCutHashCache.json"
+
+# 숏컷 저장 방식 : "json" 또는 "sqlite"
+# sqlite 를 사용하면 CivitaiShortCut.json 은 처음 한번 가져오고 내보내기용으로만 쓰인다.
+shortcut_storage = "json"
+
+# 여러 숏컷을 갱신할때 중간 저장 간격, 0이면 마지막에 한번만 저장한다.
+shortcut_update_checkpoint = 50
+
+# json 저장소의 변경 내역을 journal 파일에 추가하고, 지정 크기를 넘으면 스냅샷으로 합친다.
+journal_enable = True
+journal_compact_size = 1024 * 1024
+
+# sc_infos 모델 정보 캐시의 최대 개수와 최대 크기(byte)
+model_info_cache_max_items = 256
+model_info_cache_max_bytes = 64 * 1024 * 1024
+
+# civitai api 응답 캐시(sc_http_cache), TTL(초) 안에는 요청하지 않고 지나면 조건부 요청으로 확인한다.
+http_cache_enable = True
+http_cache_ttl = 600
+
+# Scan new version 에서 확인한 최신 버전을 다시 확인하지 않는 시간(초)
+latest_version_check_ttl = 3600
+
+# 로컬의 모델/버전 정보 파일이 이 시간(초)보다 오래되지 않았으면 civitai 에 요청하지 않는다. 0이면 항상 요청한다.
+local_info_ttl = 24 * 60 * 60
+
+# http 연결 설정
+# 연결 대기와 응답 대기 시간(초), 호스트별 연결 풀 크기
+http_connect_timeout = 10
+http_read_timeout = 60
+http_pool_maxsize = 10
+# 5xx, 429 응답이나 연결 오류시 재시도 횟수와 지수 백오프 계수(초)
+http_max_retries = 3
+http_backoff_factor = 1.0
+# civitai 요청 제한 : 초당 요청 수(0이면 제한 없음), 한번에 몰아서 보낼 수 있는 수, 최대 동시 요청 수
+http_rate_limit = 2.0
+http_rate_burst = 5
+http_max_concurrency = 4
+
+# 오프라인 모드 : civitai 에 요청하지 않고 로컬(sc_infos, 다운받은 모델의 정보)만 사용한다.
+offline_mode = False
+
+# 여러 숏컷의 정보를 갱신할때 동시에 처리하는 작업자 수와 초당 시작하는 모델 수(0이면 제한 없음)
+shortcut_update_workers = 4
+shortcut_update_rate_limit = 2.0
+
+# 숏컷 정보 백그라운드 갱신 : 마지막 갱신 후 지난 시간(초)이 ttl 보다 긴 숏컷을 interval 초마다 batch 개씩 갱신한다.
+shortcut_refresh_ttl = 7 * 24 * 60 * 60
+shortcut_refresh_interval = 60
+shortcut_refresh_batch = 10
+
+# 여러 모델의 정보를 한번에 요청할때 한 요청에 넣는 모델 수
+model_infos_chunk_size = 100
+# 여러 해시의 버전 정보를 한번에 요청할때 한 요청에 넣는 해시 수
+hash_lookup_chunk_size = 100
 
 # shortcut_thumbnail_folder =  "sc_thumb"
 shortcut_thumbnail_folder =  "sc_thumb_images"
 shortcut_recipe_folder =  "sc_recipes"
 shortcut_info_folder =  "sc_infos"
 shortcut_gallery_folder =  "sc_gallery"
+shortcut_http_cache_folder =  "sc_http_cache"
 
 no_card_preview_image = os.path.join(extension_base,"img","card-no-preview.png")
 nsfw_disable_image = os.path.join(extension_base,"img","nsfw-no-preview.png")
@@ -233,22 +304,30 @@ def init():
     global shortcut_classification
     global shortcut_civitai_internet_shortcut_url
     global shortcut_recipe
+    global shortcut_db
+    global shortcut_download_queue
+    global shortcut_hash_cache
     
     global shortcut_thumbnail_folder
     global shortcut_recipe_folder
     global shortcut_info_folder
     global shortcut_gallery_folder
+    global shortcut_http_cache_folder
 
     shortcut = os.path.join(extension_base,shortcut)
     shortcut_setting = os.path.join(extension_base,shortcut_setting)
     shortcut_classification = os.path.join(extension_base,shortcut_classification)
     shortcut_recipe = os.path.join(extension_base,shortcut_recipe)
     shortcut_civitai_internet_shortcut_url = os.path.join(extension_base,shortcut_civitai_internet_shortcut_url)
+    shortcut_db = os.path.join(extension_base,shortcut_db)
+    shortcut_download_queue = os.path.join(extension_base,shortcut_download_queue)
+    shortcut_hash_cache = os.path.join(extension_base,shortcut_hash_cache)
     
     shortcut_thumbnail_folder = os.path.join(extension_base,shortcut_thumbnail_folder)
     shortcut_recipe_folder = os.path.join(extension_base,shortcut_recipe_folder)
     shortcut_info_folder = os.path.join(extension_base,shortcut_info_folder)
     shortcut_gallery_folder = os.path.join(extension_base,shortcut_gallery_folder)
+    shortcut_http_cache_folder = os.path.join(extension_base,shortcut_http_cache_folder)
     
     load_data()        
 
@@ -272,6 +351,38 @@ def load_data():
 
     global shortcut_update_when_start
     global classification_preview_mode_disable
+    global shortcut_storage
+    global shortcut_update_checkpoint
+    global journal_enable
+    global journal_compact_size
+    global model_info_cache_max_items
+    global model_info_cache_max_bytes
+    global http_cache_enable
+    global http_cache_ttl
+    global latest_version_check_ttl
+    global local_info_ttl
+    global offline_mode
+    global http_connect_timeout
+    global http_read_timeout
+    global http_pool_maxsize
+    global http_max_retries
+    global http_backoff_factor
+    global http_rate_limit
+    global http_rate_burst
+    global http_max_concurrency
+    global shortcut_update_workers
+    global shortcut_update_rate_limit
+    global model_infos_chunk_size
+    global shortcut_refresh_ttl
+    global download_segments
+    global download_segment_threshold
+    global download_workers
+    global download_hashes
+    global download_buffer_size
+    global download_preallocate
+    global shortcut_refresh_interval
+    global shortcut_refresh_batch
+    global hash_lookup_chunk_size
 
     if shared.cmd_opts.embeddings_dir:
         model_folders['TextualInversion'] = shared.cmd_opts.embeddings_dir
@@ -373,6 +484,87 @@ def load_data():
 
             if "classification_preview_mode_disable" in temporary.keys():
                 classification_preview_mode_disable = bool(temporary['classification_preview_mode_disable']) 
+
+        if "storage" in environment.keys():
+            storage = environment['storage']
+
+            if "shortcut_storage" in storage.keys():
+                if storage['shortcut_storage'] in ("json", "sqlite"):
+                    shortcut_storage = storage['shortcut_storage']
+            if "shortcut_update_checkpoint" in storage.keys():
+                shortcut_update_checkpoint = int(storage['shortcut_update_checkpoint'])
+            if "journal_enable" in storage.keys():
+                journal_enable = bool(storage['journal_enable'])
+            if "journal_compact_size" in storage.keys():
+                journal_compact_size = int(storage['journal_compact_size'])
+
+        if "cache" in environment.keys():
+            cache = environment['cache']
+
+            if "model_info_cache_max_items" in cache.keys():
+                model_info_cache_max_items = int(cache['model_info_cache_max_items'])
+            if "model_info_cache_max_bytes" in cache.keys():
+                model_info_cache_max_bytes = int(cache['model_info_cache_max_bytes'])
+            if "http_cache_enable" in cache.keys():
+                http_cache_enable = bool(cache['http_cache_enable'])
+            if "http_cache_ttl" in cache.keys():
+                http_cache_ttl = int(cache['http_cache_ttl'])
+            if "latest_version_check_ttl" in cache.keys():
+                latest_version_check_ttl = int(cache['latest_version_check_ttl'])
+            if "local_info_ttl" in cache.keys():
+                local_info_ttl = int(cache['local_info_ttl'])
+
+        if "download" in environment.keys():
+            download = environment['download']
+
+            if "download_segments" in download.keys():
+                download_segments = int(download['download_segments'])
+            if "download_segment_threshold" in download.keys():
+                download_segment_threshold = int(download['download_segment_threshold'])
+            if "download_workers" in download.keys():
+                download_workers = max(1, int(download['download_workers']))
+            if "download_hashes" in download.keys():
+                download_hashes = list(download['download_hashes'])
+            if "download_buffer_size" in download.keys():
+                download_buffer_size = min(max(64 * 1024, int(download['download_buffer_size'])), 64 * 1024 * 1024)
+            if "download_preallocate" in download.keys():
+                download_preallocate = bool(download['download_preallocate'])
+
+        if "network" in environment.keys():
+            network = environment['network']
+
+            if "offline_mode" in network.keys():
+                offline_mode = bool(network['offline_mode'])
+            if "http_connect_timeout" in network.keys():
+                http_connect_timeout = float(network['http_connect_timeout'])
+            if "http_read_timeout" in network.keys():
+                http_read_timeout = float(network['http_read_timeout'])
+            if "http_pool_maxsize" in network.keys():
+                http_pool_maxsize = int(network['http_pool_maxsize'])
+            if "http_max_retries" in network.keys():
+                http_max_retries = int(network['http_max_retries'])
+            if "http_backoff_factor" in network.keys():
+                http_backoff_factor = float(network['http_backoff_factor'])
+            if "http_rate_limit" in network.keys():
+                http_rate_limit = float(network['http_rate_limit'])
+            if "http_rate_burst" in network.keys():
+                http_rate_burst = int(network['http_rate_burst'])
+            if "http_max_concurrency" in network.keys():
+                http_max_concurrency = max(1, int(network['http_max_concurrency']))
+            if "shortcut_update_workers" in network.keys():
+                shortcut_update_workers = max(1, int(network['shortcut_update_workers']))
+            if "shortcut_update_rate_limit" in network.keys():
+                shortcut_update_rate_limit = float(network['shortcut_update_rate_limit'])
+            if "shortcut_refresh_ttl" in network.keys():
+                shortcut_refresh_ttl = int(network['shortcut_refresh_ttl'])
+            if "shortcut_refresh_interval" in network.keys():
+                shortcut_refresh_interval = int(network['shortcut_refresh_interval'])
+            if "shortcut_refresh_batch" in network.keys():
+                shortcut_refresh_batch = max(1, int(network['shortcut_refresh_batch']))
+            if "model_infos_chunk_size" in network.keys():
+                model_infos_chunk_size = max(1, int(network['model_infos_chunk_size']))
+            if "hash_lookup_chunk_size" in network.keys():
+                hash_lookup_chunk_size = max(1, int(network['hash_lookup_chunk_size']))
     
 def generate_type_basefolder(content_type):
     
@@ -0,0 +1,85 @@
+import os
+import threading
+import contextlib
+
+from . import util
+
+# 저장소 파일(숏컷, 분류, 레시피 등)을 읽고 쓸때 사용하는 잠금
+# 프로세스 안에서는 파일 경로마다 RLock 을, 프로세스 사이에서는 <파일>.lock 에 권고 잠금을 건다.
+# 같은 스레드에서 중첩해서 잡을 수 있다.
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+_locks = dict()
+_locks_lock = threading.Lock()
+
+def get_entry(path):
+    path = os.path.abspath(path)
+    with _locks_lock:
+        if path not in _locks:
+            _locks[path] = {"lock": threading.RLock(), "depth": 0, "file": None}
+        return _locks[path]
+
+def lock_file(path):
+    try:
+        f = open(f"{path}.lock", 'a+')
+    except Exception as e:
+        util.printD(f"Unable to open lock file : {path}.lock")
+        return None
+
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            f.seek(0)
+            # msvcrt.LK_LOCK 은 10번 재시도 후 실패하므로 잡힐때까지 반복한다.
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+    except Exception as e:
+        f.close()
+        return None
+
+    return f
+
+def unlock_file(f):
+    if not f:
+        return
+
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        elif msvcrt:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    except Exception as e:
+        pass
+    finally:
+        f.close()
+
+@contextlib.contextmanager
+def lock(path):
+    entry = get_entry(path)
+
+    with entry["lock"]:
+        if entry["depth"] == 0:
+            entry["file"] = lock_file(path)
+        entry["depth"] = entry["depth"] + 1
+        try:
+            yield
+        finally:
+            entry["depth"] = entry["depth"] - 1
+            if entry["depth"] == 0:
+                unlock_file(entry["file"])
+                entry["file"] = None
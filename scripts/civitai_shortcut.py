@@ -1,7 +1,6 @@
 import os
 import datetime
 import gradio as gr
-import threading
 
 from modules import script_callbacks
 
@@ -14,6 +13,8 @@ from scripts.civitai_manager_libs import scan_action
 from scripts.civitai_manager_libs import util
 from scripts.civitai_manager_libs import ishortcut
 from scripts.civitai_manager_libs import recipe_action
+from scripts.civitai_manager_libs import refresh_scheduler
+from scripts.civitai_manager_libs import download_queue
 
 def on_civitai_tabs_select(evt: gr.SelectData):
     current_time = datetime.datetime.now() 
@@ -78,33 +79,18 @@ def civitai_shortcut_ui():
         outputs=[refresh_civitai_sc_browser, refresh_recipe , refresh_classification, refresh_setting]
     )
          
-def update_all_shortcut_informations():
-    preISC = ishortcut.load()                           
-    if not preISC:
-        return
-   
-    modelid_list = [k for k in preISC]
-    util.printD("shortcut update start")
-    for modelid in modelid_list:
-        ishortcut.write_model_information(modelid, False, None)     
-    util.printD("shortcut update end")
-
-def update_all_shortcut_informations_thread():
-    try:
-        thread = threading.Thread(target=update_all_shortcut_informations)
-        thread.start()                
-    except Exception as e:
-        util.printD(e)
-        pass
-    
 def init_civitai_shortcut():
     setting.init()
     model.update_downloaded_model()
 
     util.printD(setting.Extensions_Version)
 
+    # 지난번에 받던 모델 파일을 이어 받는다.
+    download_queue.start()
+
+    # 오래된 숏컷 정보를 백그라운드에서 조금씩 갱신한다.
     if setting.shortcut_update_when_start:        
-        update_all_shortcut_informations_thread()
+        refresh_scheduler.start()
 
 def on_ui_tabs():
     # init